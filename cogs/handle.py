@@ -136,6 +136,8 @@ class Handle(commands.Cog):
                                     f"`{res}` within {HANDLE_IDENTIFY_WAIT_TIME} seconds {ctx.author.mention}")
         await asyncio.sleep(HANDLE_IDENTIFY_WAIT_TIME)
 
+        # The first name must be read after the user changed it, not from the lookup above
+        cf_api.cache.invalidate('user.info', handle)
         if res != await self.cf.get_first_name(handle):
             await discord_.send_message(ctx, f"Unable to set handle, please try again {ctx.author.mention}")
             return
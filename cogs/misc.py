@@ -8,7 +8,8 @@ from psutil import Process, virtual_memory
 
 from constants import OWNERS
 from data import dbconn
-from utils import tasks
+from utils import cf_api, tasks, updation
+from utils.poll_schedule import schedule
 
 
 class Misc(commands.Cog):
@@ -50,6 +51,79 @@ class Misc(commands.Cog):
         await tasks.scrape_authors(self.client)
         await ctx.send(embed=discord.Embed(description="Done", color=discord.Color.green()))
 
+    @commands.command(name="cronleaders", hidden=True)
+    async def cronleaders(self, ctx):
+        if ctx.author.id not in OWNERS:
+            return
+        desc = ""
+        for job, holder in tasks.cron_leaders().items():
+            desc += f"`{job}`: **{holder or 'nobody yet'}**{' (this process)' if holder == tasks.WORKER_ID else ''}\n"
+        await ctx.send(embed=discord.Embed(description=desc, color=discord.Color.green()))
+
+    @commands.command(name="apistats", hidden=True)
+    async def apistats(self, ctx):
+        if ctx.author.id not in OWNERS:
+            return
+        desc = ""
+        for lane, stats in cf_api.limiter.stats().items():
+            desc += f"**{lane.title()} requests**\n"
+            desc += f"Queue depth: **{stats['queue_depth']}**\n"
+            desc += f"Calls: **{stats['acquired']}** ({stats['delayed']} delayed)\n"
+            desc += f"Wait: **{stats['avg_wait']:.2f}s** avg, **{stats['max_wait']:.2f}s** max\n\n"
+        desc += f"**Coalescing**\n"
+        desc += f"Requests: **{cf_api.request_stats['requests']}** ({cf_api.request_stats['coalesced']} shared an in-flight call)\n"
+        desc += f"Past deadline: **{cf_api.request_stats['deadline_exceeded']}** calls, "
+        desc += f"{tasks.tick_stats['deadline_hits']} updates cut short, "
+        desc += f"{tasks.tick_stats['deferred_matches']} matches and {tasks.tick_stats['deferred_rounds']} rounds carried over\n\n"
+        desc += f"**Polling strategies**\n"
+        for method, stats in updation.poll_stats.items():
+            desc += f"`{method}`: **{stats['polls']}** polls, {stats['requests']} requests, "
+            desc += f"{stats['submissions']} submissions, **{stats['bytes'] / 1024:.0f} KiB** received"
+            desc += f" ({stats['bytes'] / max(stats['polls'], 1) / 1024:.1f} KiB per poll)\n"
+        desc += "\n"
+        cache = cf_api.cache.stats()
+        desc += f"**Response cache**\n"
+        desc += f"Entries: **{cache['size']}** ({cache['evictions']} evicted)\n"
+        desc += f"Hits: **{cache['hits']}**, misses: **{cache['misses']}**\n\n"
+        desc += f"**Circuit breakers**\n"
+        for method, breaker in cf_api.breakers.items():
+            stats = breaker.stats()
+            desc += f"`{method}`: **{stats['state']}** ({stats['failures']} failures, {stats['rejected']} rejected"
+            desc += f", retry in {stats['retry_in']:.0f}s)\n" if stats['state'] != 'closed' else ")\n"
+        await ctx.send(embed=discord.Embed(description=desc, color=discord.Color.green()))
+
+    @commands.command(name="updatestats", hidden=True)
+    async def updatestats(self, ctx):
+        if ctx.author.id not in OWNERS:
+            return
+        desc = ""
+        tick = tasks.update_runner.stats()
+        desc += f"**Update ticks**\n"
+        desc += f"Ticks: **{tick['ticks']}** ({tick['overruns']} overran, {tick['skipped']} coalesced, {tick['errors']} failed)"
+        desc += f"{', running now' if tick['running'] else ''}\n"
+        desc += f"Duration: **{tick['avg_duration']:.2f}s** avg, **{tick['max_duration']:.2f}s** max, "
+        desc += f"start lag **{tick['max_lag']:.2f}s** max\n"
+        desc += f"Items: **{tick['processed']}** processed, **{tick['deferred']}** deferred\n"
+        if tick['last']:
+            desc += f"Last tick: {tick['last']['processed']} processed, {tick['last']['deferred']} deferred in "
+            desc += f"{tick['last']['duration']:.2f}s, started {tick['last']['lag']:.2f}s late\n"
+        desc += "\n"
+        desc += f"**Update workers**\n"
+        for worker, count in self.db.get_work_leases().items():
+            desc += f"`{worker}`: **{count}** matches and rounds{' (this process)' if worker == tasks.WORKER_ID else ''}\n"
+        desc += "\n"
+        desc += f"**Update pipeline**\n"
+        for stage in tasks.stages:
+            stats = stage.stats()
+            desc += f"`{stage.name}`: queue **{stats['depth']}**/{stats['capacity']} (max {stats['max_depth']}), "
+            desc += f"{stats['busy']}/{stats['workers']} workers busy, {stats['processed']} done, {stats['errors']} failed\n"
+        desc += "\n"
+        poll = schedule.stats(time.time())
+        desc += f"**Poll schedule**\n"
+        desc += f"Tracking **{poll['tracked']}** matches and rounds, **{poll['due']}** due, "
+        desc += f"polled every **{poll['avg_interval']:.0f}s** on average\n"
+        await ctx.send(embed=discord.Embed(description=desc, color=discord.Color.green()))
+
     @commands.command()
     async def botinfo(self, ctx):
         handles = self.db.get_count('handles')
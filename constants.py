@@ -1,4 +1,22 @@
-AUTO_UPDATE_TIME = 20
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv('.env')
+
+AUTO_UPDATE_TIME = 5  # seconds between checks for matches and rounds that are due a poll
+TICK_DEADLINE = 4  # seconds an update run may spend on external calls, keep below AUTO_UPDATE_TIME
+# Each match/round is polled every POLL_MIN_INTERVAL seconds right after it starts, near its end and
+# while something is happening, backing off up to POLL_MAX_INTERVAL while it is idle
+POLL_MIN_INTERVAL = 15
+POLL_MAX_INTERVAL = 120
+POLL_EDGE_WINDOW = 300  # seconds after the start and before the end that count as busy
+REPLACEMENT_DEADLINE = 10  # seconds to pick a new problem after one is solved in a repeat round
+UPDATE_CONCURRENCY = 10  # matches and rounds checked for changes at the same time
+NOTIFY_WORKERS = 5  # channels sent standings updates at the same time
+PIPELINE_QUEUE_SIZE = 100  # items each update stage can have waiting before the previous one blocks
+# Seconds a bot process keeps a match/round to itself without renewing the lease, renewed every update
+WORK_LEASE_TIME = 60
 
 PREFIX = "&"
 
@@ -8,3 +26,32 @@ ALLOWED_CHANNEL = [826648325398724619]
 
 BACKUP_DIR = "./data/backup/"
 LOG_FILE_PATH = "./logs/lockout.log"
+
+# Timeouts for requests to external APIs (Codeforces, Challonge), in seconds
+API_CONNECT_TIMEOUT = 5
+API_READ_TIMEOUT = 15
+
+# Codeforces API client
+CF_API_CONNECTION_LIMIT = 10  # simultaneous connections to codeforces.com
+CF_API_DNS_CACHE_TTL = 300  # seconds
+CF_API_KEEPALIVE_TIMEOUT = 30  # seconds an idle connection is kept open
+# Calls per second, the API docs ask for one call per two seconds. In practice "Call limit exceeded"
+# only shows up above roughly five calls per second per IP, set CF_API_RATE_LIMIT=4 to use that.
+CF_API_RATE_LIMIT = float(os.environ.get('CF_API_RATE_LIMIT') or 0.5)
+CF_API_BURST = max(1, int(CF_API_RATE_LIMIT))
+# Seconds a successful response stays cached, per API method. Match polling always fetches
+# fresh responses, these only serve commands and problem selection.
+CF_API_CACHE_TTL = {
+    'user.info': 60,
+    'user.status': 10,
+    'contest.status': 10
+}
+CF_API_CACHE_SIZE = 1000  # responses kept before the least recently used ones are dropped
+SOLVED_CACHE_SIZE = 500  # handles whose solved problems are kept in memory
+CF_API_RETRIES = 5
+CF_API_BACKOFF_BASE = 0.5  # seconds, doubled on every retry
+CF_API_BACKOFF_MAX = 8
+# Failed calls (after retries) to one API method before requests to it are paused
+CF_API_BREAKER_THRESHOLD = 3
+CF_API_BREAKER_RESET = 30  # seconds before a probe request, doubled while probes keep failing
+CF_API_BREAKER_MAX_RESET = 600
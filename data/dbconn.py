@@ -1,9 +1,11 @@
 import os
+import socket
 import time
 from collections import namedtuple
 
 import psycopg2
 from dotenv import load_dotenv
+from psycopg2.extras import execute_values
 
 
 class DbConn:
@@ -14,7 +16,8 @@ class DbConn:
             user=os.environ.get("DB_USERNAME"),
             password=os.environ.get("DB_PASSWORD"),
             host=os.environ.get("DB_HOST"),
-            port="5432")
+            port="5432",
+            application_name=f"{socket.gethostname()}:{os.getpid()}")
         self.make_tables()
 
     def make_tables(self):
@@ -43,6 +46,9 @@ class DbConn:
                             name TEXT
                     )
                     """)
+        cmds.append("""
+                        ALTER TABLE contests ADD COLUMN IF NOT EXISTS eligible BOOLEAN
+                    """)
         cmds.append("""
                         CREATE TABLE IF NOT EXISTS challenge(
                             guild BIGINT,
@@ -156,6 +162,49 @@ class DbConn:
                             challonge_id BIGINT
                     )
                     """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS submission_sync(
+                            handle TEXT,
+                            last_id BIGINT,
+                            last_time INT
+                    )
+                    """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS user_solved(
+                            handle TEXT,
+                            id INT,
+                            index TEXT,
+                            time INT
+                    )
+                    """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS work_leases(
+                            item TEXT PRIMARY KEY,
+                            worker TEXT,
+                            expires INT
+                    )
+                    """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS work_workers(
+                            worker TEXT PRIMARY KEY,
+                            expires INT
+                    )
+                    """)
+        cmds.append("""
+                        CREATE TABLE IF NOT EXISTS problem_authors(
+                            contest INT,
+                            handle TEXT,
+                            updated INT
+                    )
+                    """)
+        cmds.append("""
+                        CREATE UNIQUE INDEX IF NOT EXISTS submission_sync_handle
+                        ON submission_sync (handle)
+                    """)
+        cmds.append("""
+                        CREATE UNIQUE INDEX IF NOT EXISTS user_solved_problem
+                        ON user_solved (handle, id, index)
+                    """)
         try:
             curr = self.conn.cursor()
             for x in cmds:
@@ -380,21 +429,6 @@ class DbConn:
             data.append(Problem(x[0], x[1], x[2], x[3], x[4]))
         return data
 
-    def get_contest_name(self, contest_id):
-        query = f"""
-                    SELECT name FROM contests
-                    WHERE
-                    id = %s
-                """
-        curr = self.conn.cursor()
-        curr.execute(query, (contest_id,))
-        data = curr.fetchone()
-        curr.close()
-        #  print(id)
-        if len(data) == 0:
-            return "69"
-        return data[0]
-
     def add_to_ongoing(self, challenge_info, time, problems):
         query = """
                     INSERT INTO ongoing
@@ -738,15 +772,41 @@ class DbConn:
         self.conn.commit()
         curr.close()
 
-    def add_contest(self, id, name):
+    def add_contest(self, id, name, eligible=True):
         query = f"""
                     INSERT INTO contests
-                    (id, name)
+                    (id, name, eligible)
                     VALUES
-                    (%s, %s)
+                    (%s, %s, %s)
+                """
+        curr = self.conn.cursor()
+        curr.execute(query, (id, name, eligible))
+        self.conn.commit()
+        curr.close()
+
+    # unflagged: only the contests stored before the eligible flag existed
+    def get_contests(self, unflagged=False):
+        query = f"""
+                    SELECT id, name, eligible FROM contests
+                    {'WHERE eligible IS NULL' if unflagged else ''}
                 """
         curr = self.conn.cursor()
-        curr.execute(query, (id, name))
+        curr.execute(query)
+        data = curr.fetchall()
+        curr.close()
+        Contest = namedtuple('Contest', 'id name eligible')
+        return [Contest(x[0], x[1], x[2]) for x in data]
+
+    # flags = [(contest id, eligible), ...]
+    def set_contest_eligibility(self, flags):
+        query = f"""
+                    UPDATE contests
+                    SET eligible = data.eligible
+                    FROM (VALUES %s) AS data (id, eligible)
+                    WHERE contests.id = data.id
+                """
+        curr = self.conn.cursor()
+        execute_values(curr, query, flags, page_size=1000)
         self.conn.commit()
         curr.close()
 
@@ -936,3 +996,207 @@ class DbConn:
         curr.close()
         Tournament = namedtuple("Tournament", "guild name type id url winner time")
         return [Tournament(x[0], x[1], x[2], x[3], x[4], x[5], x[6]) for x in data]
+
+    def get_sync_state(self, handle):
+        query = f"""
+                    SELECT last_id, last_time FROM submission_sync
+                    WHERE handle = %s
+                """
+        curr = self.conn.cursor()
+        curr.execute(query, (handle, ))
+        data = curr.fetchone()
+        curr.close()
+        if not data:
+            return None
+        SyncState = namedtuple('SyncState', 'last_id last_time')
+        return SyncState(data[0], data[1])
+
+    def update_sync_state(self, handle, last_id, last_time):
+        query = f"""
+                    INSERT INTO submission_sync
+                    VALUES
+                    (%s, %s, %s)
+                    ON CONFLICT (handle) DO UPDATE
+                    SET
+                    last_id = EXCLUDED.last_id,
+                    last_time = EXCLUDED.last_time
+                """
+        curr = self.conn.cursor()
+        curr.execute(query, (handle, last_id, last_time))
+        self.conn.commit()
+        curr.close()
+
+    # Union of the (id, index) pairs solved by any of the handles
+    def get_solved_problems(self, handles):
+        query = f"""
+                    SELECT DISTINCT id, index FROM user_solved
+                    WHERE handle = ANY(%s)
+                """
+        curr = self.conn.cursor()
+        curr.execute(query, (list(handles), ))
+        data = curr.fetchall()
+        curr.close()
+        return set((x[0], x[1]) for x in data)
+
+    # problems = [(id, index, time), ...], keeps the earliest AC time of every problem
+    def add_solved_problems(self, handle, problems):
+        query = f"""
+                    INSERT INTO user_solved
+                    VALUES %s
+                    ON CONFLICT (handle, id, index) DO UPDATE
+                    SET time = LEAST(user_solved.time, EXCLUDED.time)
+                """
+        curr = self.conn.cursor()
+        execute_values(curr, query, [(handle, x[0], x[1], x[2]) for x in problems], page_size=1000)
+        self.conn.commit()
+        curr.close()
+
+    # authors = [(contest id, handle), ...], replaces what was stored before
+    def set_problem_authors(self, authors):
+        curr = self.conn.cursor()
+        curr.execute("DELETE FROM problem_authors")
+        execute_values(curr, "INSERT INTO problem_authors VALUES %s",
+                       [(x[0], x[1], int(time.time())) for x in authors], page_size=1000)
+        self.conn.commit()
+        curr.close()
+
+    def get_problem_authors(self):
+        query = f"""
+                    SELECT contest, handle FROM problem_authors
+                """
+        curr = self.conn.cursor()
+        curr.execute(query)
+        data = curr.fetchall()
+        curr.close()
+        return data
+
+    # When the stored authors were last replaced, None if they never were
+    def get_problem_authors_version(self):
+        query = f"""
+                    SELECT MAX(updated) FROM problem_authors
+                """
+        curr = self.conn.cursor()
+        curr.execute(query)
+        data = curr.fetchone()
+        curr.close()
+        return data[0]
+
+    # Renews the leases worker holds on items and claims free or expired ones, up to its share of the items
+    # among the workers alive. Returns the items it holds now.
+    def claim_work_items(self, worker, items, lease_time):
+        now = int(time.time())
+        curr = self.conn.cursor()
+        if items:
+            execute_values(curr, "INSERT INTO work_leases VALUES %s ON CONFLICT (item) DO NOTHING",
+                           [(x, None, 0) for x in items])
+        # Items that are over, once nobody holds them anymore
+        curr.execute("DELETE FROM work_leases WHERE item <> ALL(%s::text[]) AND expires < %s", (list(items), now))
+        # Heartbeat, a worker counts towards the split as soon as it starts even if it holds nothing yet
+        curr.execute("""INSERT INTO work_workers VALUES (%s, %s)
+                        ON CONFLICT (worker) DO UPDATE SET expires = EXCLUDED.expires""", (worker, now + lease_time))
+        curr.execute("DELETE FROM work_workers WHERE expires < %s", (now, ))
+        curr.execute("SELECT COUNT(*) FROM work_workers WHERE worker <> %s", (worker, ))
+        share = -(-len(items) // (curr.fetchone()[0] + 1))
+        query = f"""
+                    UPDATE work_leases
+                    SET
+                    worker = %s,
+                    expires = %s
+                    WHERE item IN (
+                        SELECT item FROM work_leases
+                        WHERE
+                        item = ANY(%s::text[]) AND
+                        (worker = %s OR expires < %s)
+                        ORDER BY worker IS NOT DISTINCT FROM %s DESC, expires
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING item
+                """
+        curr.execute(query, (worker, now + lease_time, list(items), worker, now, worker, share))
+        data = curr.fetchall()
+        # Hand over what is above the share right away instead of letting the leases run out
+        curr.execute("""UPDATE work_leases SET worker = NULL, expires = 0
+                        WHERE worker = %s AND item <> ALL(%s::text[])""", (worker, [x[0] for x in data]))
+        self.conn.commit()
+        curr.close()
+        return set(x[0] for x in data)
+
+    def holds_work_item(self, worker, item):
+        query = f"""
+                    SELECT item FROM work_leases
+                    WHERE
+                    item = %s AND
+                    worker = %s AND
+                    expires >= %s
+                """
+        curr = self.conn.cursor()
+        curr.execute(query, (item, worker, int(time.time())))
+        data = curr.fetchone()
+        curr.close()
+        return data is not None
+
+    def release_work_items(self, worker):
+        query = f"""
+                    UPDATE work_leases
+                    SET
+                    worker = NULL,
+                    expires = 0
+                    WHERE
+                    worker = %s
+                """
+        curr = self.conn.cursor()
+        curr.execute(query, (worker, ))
+        curr.execute("DELETE FROM work_workers WHERE worker = %s", (worker, ))
+        self.conn.commit()
+        curr.close()
+
+    def get_live_workers(self):
+        query = f"""
+                    SELECT worker FROM work_workers
+                    WHERE
+                    expires >= %s
+                """
+        curr = self.conn.cursor()
+        curr.execute(query, (int(time.time()), ))
+        data = curr.fetchall()
+        curr.close()
+        return [x[0] for x in data]
+
+    def get_work_leases(self):
+        query = f"""
+                    SELECT w.worker, COUNT(l.item) FROM work_workers w
+                    LEFT JOIN work_leases l ON l.worker = w.worker AND l.expires >= %s
+                    GROUP BY w.worker
+                """
+        curr = self.conn.cursor()
+        curr.execute(query, (int(time.time()), ))
+        data = curr.fetchall()
+        curr.close()
+        return {x[0]: x[1] for x in data}
+
+    # Session level lock, held until this connection closes
+    def try_advisory_lock(self, key1, key2):
+        curr = self.conn.cursor()
+        curr.execute("SELECT pg_try_advisory_lock(%s, %s)", (key1, key2))
+        data = curr.fetchone()
+        self.conn.commit()
+        curr.close()
+        return data[0]
+
+    # key2 -> application name (host:pid) of the connection holding advisory lock (key1, key2)
+    def get_advisory_lock_holders(self, key1):
+        query = f"""
+                    SELECT l.objid, a.application_name FROM pg_locks l
+                    JOIN pg_stat_activity a ON a.pid = l.pid
+                    WHERE
+                    l.locktype = 'advisory' AND
+                    l.granted AND
+                    l.classid = %s AND
+                    l.objsubid = 2
+                """
+        curr = self.conn.cursor()
+        curr.execute(query, (key1, ))
+        data = curr.fetchall()
+        curr.close()
+        return {int(x[0]): x[1] for x in data}
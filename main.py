@@ -11,12 +11,23 @@ from discord.ext.commands import (BadArgument, Bot, CommandNotFound,
                                   MissingPermissions, MissingRequiredArgument,
                                   when_mentioned_or)
 
-from constants import AUTO_UPDATE_TIME, LOG_FILE_PATH, PREFIX
-from utils import tasks
+from constants import LOG_FILE_PATH, PREFIX
+from utils import cf_api, codeforces, tasks
+
+
+class LockoutBot(Bot):
+    async def close(self):
+        tasks.update_runner.stop()
+        for stage in tasks.stages:
+            stage.stop()
+        tasks.db.release_work_items(tasks.WORKER_ID)
+        await super().close()
+        await cf_api.close_session()
+
 
 intents = discord.Intents.default()
 intents.members = False
-client = Bot(
+client = LockoutBot(
     case_insensitive=True,
     description="Lockout Bot",
     command_prefix=when_mentioned_or(PREFIX),
@@ -27,18 +38,24 @@ client = Bot(
 async def on_ready():
     await client.change_presence(activity=discord.Game(name="in matches ⚔️"))
 
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(update, 'interval', seconds=AUTO_UPDATE_TIME)
-    scheduler.add_job(tasks.create_backup, CronTrigger(hour="0, 6, 12, 18", timezone="Asia/Kolkata"), [client])
-    scheduler.add_job(tasks.update_ratings, CronTrigger(minute="30", timezone="Asia/Kolkata"), [client])
-    scheduler.add_job(tasks.update_problemset, CronTrigger(hour="8", timezone="Asia/Kolkata"), [client])
-    scheduler.add_job(tasks.scrape_authors, CronTrigger(day_of_week="0", timezone="Asia/Kolkata"), [client])
+    # on_ready fires again after every reconnect, the jobs must only be set up once
+    if tasks.update_runner.task is not None:
+        return
+    codeforces.load_catalog()
+    tasks.update_runner.start(update)
+    scheduler = AsyncIOScheduler(job_defaults={'coalesce': True, 'max_instances': 1})
+    # With several processes running, each job runs in only one of them, see tasks.singleton
+    scheduler.add_job(tasks.singleton(tasks.create_backup), CronTrigger(hour="0, 6, 12, 18", timezone="Asia/Kolkata"), [client])
+    scheduler.add_job(tasks.singleton(tasks.update_ratings), CronTrigger(minute="30", timezone="Asia/Kolkata"), [client])
+    scheduler.add_job(tasks.singleton(tasks.update_problemset), CronTrigger(hour="8", timezone="Asia/Kolkata"), [client])
+    scheduler.add_job(tasks.singleton(tasks.scrape_authors), CronTrigger(day_of_week="0", timezone="Asia/Kolkata"), [client])
+    # Every process picks up the problems added by whichever one ran update_problemset
+    scheduler.add_job(tasks.reload_catalog, CronTrigger(hour="9", timezone="Asia/Kolkata"), [client])
     scheduler.start()
 
 
-async def update():
-    await tasks.update_matches(client)
-    await tasks.update_rounds(client)
+async def update(deadline):
+    return await tasks.update(client, deadline)
 
 
 @client.event
@@ -1,46 +1,338 @@
 import asyncio
 import logging
-from collections import namedtuple
+import random
+import re
+import time
+from collections import OrderedDict
 
 import aiohttp
 
+from constants import (API_CONNECT_TIMEOUT, API_READ_TIMEOUT,
+                       CF_API_BACKOFF_BASE, CF_API_BACKOFF_MAX,
+                       CF_API_BREAKER_MAX_RESET, CF_API_BREAKER_RESET,
+                       CF_API_BREAKER_THRESHOLD, CF_API_BURST,
+                       CF_API_CACHE_SIZE, CF_API_CACHE_TTL,
+                       CF_API_CONNECTION_LIMIT, CF_API_DNS_CACHE_TTL,
+                       CF_API_KEEPALIVE_TIMEOUT, CF_API_RATE_LIMIT,
+                       CF_API_RETRIES)
+from utils import rate_limiter
+from utils.circuit_breaker import CLOSED, HALF_OPEN, CircuitBreaker
+
+# One pooled session per process, shared by every CodeforcesAPI instance so
+# that connections to codeforces.com are kept alive between polls.
+_session = None
+
+# Every request to codeforces.com, from any module, takes a token from here first.
+limiter = rate_limiter.RequestScheduler(CF_API_RATE_LIMIT, CF_API_BURST)
+
+# One circuit breaker per API method (user.status, user.info, ...), created on first use
+breakers = {}
+
+USER_INFO_URL = "https://codeforces.com/api/user.info"
+USER_INFO_CHAR_LIMIT = 3000
+USER_INFO_BATCH_WINDOW = 0.005  # seconds
+
+# Lane -> UserInfoBatcher, see get_batcher
+batchers = {}
+
+# Requests currently on the wire, keyed by url and params. Identical concurrent calls wait on the same future.
+_inflight = {}
+# Number of callers waiting on each in-flight future, a request nobody waits for anymore is cancelled
+_waiters = {}
+request_stats = {'requests': 0, 'coalesced': 0, 'deadline_exceeded': 0}
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class ResponseCache:
+    def __init__(self, ttls, max_size):
+        self.ttls = ttls
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def parse_args(key):
+        url, params = key
+        query = url.partition('?')[2]
+        args = dict(x.partition('=')[::2] for x in query.split('&') if x)
+        args.update(dict(params or ()))
+        return args
+
+    @staticmethod
+    def parse_key(key):
+        # Returns the API method and the lowercased handles a cache key refers to
+        args = ResponseCache.parse_args(key)
+        handles = args.get('handles', args.get('handle', ''))
+        return api_method(key[0]), set(x.lower() for x in handles.split(';') if x)
+
+    def get(self, key):
+        method, _ = self.parse_key(key)
+        if method not in self.ttls:
+            return None
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, response):
+        method, _ = self.parse_key(key)
+        if method not in self.ttls:
+            return
+        # A user.status call without count is a handle's whole history, several MB that nobody asks for twice
+        if method == 'user.status' and 'count' not in self.parse_args(key):
+            return
+        now = time.monotonic()
+        # Expired entries hold on to their responses until dropped, don't wait for the same key to be read again
+        for expired in [x for x, entry in self.entries.items() if entry[0] < now]:
+            del self.entries[expired]
+        self.entries[key] = (now + self.ttls[method], response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, method=None, handle=None):
+        for key in list(self.entries):
+            key_method, handles = self.parse_key(key)
+            if (method is None or method == key_method) and (handle is None or handle.lower() in handles):
+                del self.entries[key]
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+cache = ResponseCache(CF_API_CACHE_TTL, CF_API_CACHE_SIZE)
+
+
+def _request_done(key, priority, future):
+    _inflight.pop(key, None)
+    if future.cancelled() or future.exception() is not None:
+        return
+    response = future.result()
+    # Bulk jobs go through every handle, caching their responses would only push out the ones commands reuse
+    if response and response['status'] == 'OK' and priority != rate_limiter.BULK:
+        cache.put(key, response)
+
+
+def get_session():
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit_per_host=CF_API_CONNECTION_LIMIT,
+                                         ttl_dns_cache=CF_API_DNS_CACHE_TTL,
+                                         keepalive_timeout=CF_API_KEEPALIVE_TIMEOUT)
+        timeout = aiohttp.ClientTimeout(sock_connect=API_CONNECT_TIMEOUT, sock_read=API_READ_TIMEOUT)
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _session
+
+
+def api_method(url):
+    return url.split('/api/')[-1].partition('?')[0]
+
+
+def share_rate_limit(workers):
+    # Processes on the same host share its IP and so the Codeforces limit, each gets an equal part of it
+    workers = max(workers, 1)
+    limiter.set_rate(CF_API_RATE_LIMIT / workers, max(1, CF_API_BURST // workers))
+
+
+def get_breaker(method):
+    if method not in breakers:
+        breakers[method] = CircuitBreaker(f"Codeforces {method}", CF_API_BREAKER_THRESHOLD,
+                                          CF_API_BREAKER_RESET, CF_API_BREAKER_MAX_RESET)
+    return breakers[method]
+
+
+def is_available(method):
+    return get_breaker(method).available()
+
+
+def is_closed(method):
+    return get_breaker(method).state == CLOSED
+
+
+def split_handles(handles, char_limit=USER_INFO_CHAR_LIMIT):
+    # Groups handles so that every user.info request stays under the url length limit
+    segments = []
+    curr = []
+    c = 0
+    for handle in handles:
+        if curr and len(handle) + c > char_limit:
+            segments.append(curr)
+            curr = []
+            c = 0
+        curr.append(handle)
+        c += len(handle) + 1
+    if curr:
+        segments.append(curr)
+    return segments
+
+
+class UserInfoBatcher:
+    def __init__(self, api, window):
+        self.api = api
+        self.window = window
+        self.pending = {}
+        self.timer = None
+
+    async def lookup(self, handle):
+        # Lookups made within the same window are resolved by a single check_handles call
+        future = asyncio.get_event_loop().create_future()
+        self.pending.setdefault(handle, []).append(future)
+        if self.timer is None:
+            self.timer = asyncio.get_event_loop().call_later(self.window, lambda: asyncio.ensure_future(self.flush()))
+        return await future
+
+    async def flush(self):
+        pending, self.pending, self.timer = self.pending, {}, None
+        try:
+            res = await self.api.check_handles(list(pending))
+        except Exception as e:
+            res = [[False, str(e)]] * len(pending)
+        for futures, resp in zip(pending.values(), res):
+            for future in futures:
+                if not future.done():
+                    future.set_result(resp)
+
+
+def get_batcher(api):
+    # One per lane shared by every CodeforcesAPI instance, so lookups made anywhere within a window share a request
+    if api.priority not in batchers:
+        batchers[api.priority] = UserInfoBatcher(api, USER_INFO_BATCH_WINDOW)
+    return batchers[api.priority]
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
 
 class CodeforcesAPI:
-    def __init__(self):
+    def __init__(self, priority=rate_limiter.INTERACTIVE):
+        # Lane used for every request made through this instance, see rate_limiter
+        self.priority = priority
         self.logger = logging.getLogger(self.__class__.__name__)
 
-    async def api_response(self, url, params=None):
+    async def api_response(self, url, params=None, deadline=None):
+        # deadline is a time.monotonic() value, DeadlineExceeded is raised if the response isn't in by then
+        key = (url, tuple(sorted(params.items())) if params else None)
+        # Match polling decides results from what it reads, it must never see submissions from before it started
+        response = cache.get(key) if self.priority != rate_limiter.POLLING else None
+        if response is not None:
+            return response
+        request_stats['requests'] += 1
+        if key in _inflight:
+            request_stats['coalesced'] += 1
+        else:
+            future = asyncio.ensure_future(self._api_response(url, params))
+            future.add_done_callback(lambda f: _request_done(key, self.priority, f))
+            _inflight[key] = future
+        future = _inflight[key]
+        _waiters[future] = _waiters.get(future, 0) + 1
         try:
-            tries = 0
-            async with aiohttp.ClientSession() as session:
-                while tries < 5:
-                    tries += 1
-                    async with session.get(url, params=params) as resp:
-                        response = {}
-                        if resp.status == 503:
-                            response['status'] = "FAILED"
-                            response['comment'] = "limit exceeded"
-                        else:
-                            response = await resp.json()
-
-                        if response['status'] == 'FAILED' and 'limit exceeded' in response['comment'].lower():
-                            await asyncio.sleep(1)
-                        else:
-                            return response
-                return response
-        except Exception as e:
-            self.logger(f"Api response error: {e}")
+            # Shielded so that one caller giving up doesn't fail the request for everyone else
+            return await asyncio.wait_for(asyncio.shield(future),
+                                          None if deadline is None else deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            request_stats['deadline_exceeded'] += 1
+            raise DeadlineExceeded(url)
+        except CircuitOpen:
+            # Polling puts the item off until Codeforces is back, everyone else gets the usual failed response
+            if self.priority == rate_limiter.POLLING:
+                raise
             return None
+        finally:
+            _waiters[future] -= 1
+            if not _waiters[future]:
+                del _waiters[future]
+                if not future.done():
+                    future.cancel()
+
+    async def _api_response(self, url, params):
+        breaker = get_breaker(api_method(url))
+        if not breaker.allow():
+            raise CircuitOpen(url)
+        response = None
+        # A half-open probe is a single call, retrying it would only keep hammering an endpoint that may be down
+        for attempt in range(1 if breaker.state == HALF_OPEN else CF_API_RETRIES):
+            if attempt:
+                # Exponential backoff with full jitter, so that callers failing together don't retry together
+                await asyncio.sleep(random.uniform(0, min(CF_API_BACKOFF_MAX, CF_API_BACKOFF_BASE * 2 ** attempt)))
+            try:
+                await limiter.acquire(self.priority)
+                async with get_session().get(url, params=params) as resp:
+                    if resp.status == 503:
+                        response = {'status': "FAILED", 'comment': "limit exceeded"}
+                        continue
+                    body = await resp.read()
+                    response = await resp.json()
+                    # Bytes received, for callers comparing how much different requests cost
+                    response['size'] = len(body)
+            except Exception as e:
+                self.logger.debug(f"Api response error: {e}")
+                response = None
+                continue
+            if response['status'] == 'FAILED' and 'limit exceeded' in response['comment'].lower():
+                continue
+            breaker.record_success()
+            return response
+        breaker.record_failure()
+        return response
 
     async def check_handle(self, handle):
-        url = f"https://codeforces.com/api/user.info?handles={handle}"
-        response = await self.api_response(url)
-        if not response:
-            return [False, "Codeforces API Error"]
-        if response["status"] != "OK":
-            return [False, response["comment"]]
-        else:
-            return [True, response["result"][0]]
+        return await get_batcher(self).lookup(handle)
+
+    async def check_handles(self, handles):
+        res = {}
+        missing = []
+        for handle in dict.fromkeys(handles):
+            cached = cache.get((USER_INFO_URL, (('handles', handle), )))
+            if cached is not None:
+                res[handle] = [True, cached['result'][0]]
+            else:
+                missing.append(handle)
+
+        for segment in split_handles(missing):
+            while segment:
+                response = await self.api_response(USER_INFO_URL, {'handles': ';'.join(segment)})
+                if not response:
+                    res.update({handle: [False, "Codeforces API Error"] for handle in segment})
+                    break
+                if response['status'] == 'OK':
+                    for handle, user in zip(segment, response['result']):
+                        res[handle] = [True, user]
+                        if self.priority != rate_limiter.BULK:
+                            cache.put((USER_INFO_URL, (('handles', handle), )), {'status': 'OK', 'result': [user]})
+                    break
+                # A single unknown handle fails the whole request, drop it and ask again for the rest
+                unknown = re.match(r"handles: User with handle (.+) not found", response['comment'])
+                unknown = [x for x in segment if unknown and x.lower() == unknown.group(1).lower()]
+                if not unknown:
+                    res.update({handle: [False, response['comment']] for handle in segment})
+                    break
+                res[unknown[0]] = [False, response['comment']]
+                segment = [x for x in segment if x != unknown[0]]
+
+        return [res[handle] for handle in handles]
 
     async def get_contest_list(self):
         url = "https://codeforces.com/api/contest.list"
@@ -58,47 +350,39 @@ class CodeforcesAPI:
         else:
             return response['result']['problems']
 
-    async def get_user_problems(self, handle, count=None):
+    # Raw submission objects, newest first, and the size of the response in bytes
+    async def get_user_submissions(self, handle, start=1, count=None, deadline=None):
         url = f"https://codeforces.com/api/user.status?handle={handle}"
         if count:
-            url += f"&from=1&count={count}"
-        response = await self.api_response(url)
+            url += f"&from={start}&count={count}"
+        response = await self.api_response(url, deadline=deadline)
         if not response:
             return [False, "CF API Error"]
         if response['status'] != 'OK':
             return [False, response['comment']]
-        try:
-            data = []
-            Problem = namedtuple(
-                'Problem', 'id index name type rating, sub_time, verdict')
-            for x in response['result']:
-                y = x['problem']
-                if 'rating' not in y:
-                    continue
-                if 'verdict' not in x:
-                    x['verdict'] = None
-                data.append(Problem(y['contestId'], y['index'], y['name'], y['type'], y['rating'],
-                                    x['creationTimeSeconds'], x['verdict']))
-            return [True, data]
-        except Exception as e:
-            return [False, str(e)]
+        return [True, response['result'], response.get('size', 0)]
+
+    # Raw submission objects of one handle in one contest, newest first, and the size of the response in bytes
+    async def get_contest_submissions(self, contest_id, handle, deadline=None):
+        url = f"https://codeforces.com/api/contest.status?contestId={contest_id}&handle={handle}"
+        response = await self.api_response(url, deadline=deadline)
+        if not response:
+            return [False, "CF API Error"]
+        if response['status'] != 'OK':
+            return [False, response['comment']]
+        return [True, response['result'], response.get('size', 0)]
 
     async def get_rating(self, handle):
-        url = f"https://codeforces.com/api/user.info?handles={handle}"
-        response = await self.api_response(url)
-        if response is None:
+        resp = await self.check_handle(handle)
+        if not resp[0]:
             return None
-        if 'rating' in response["result"][0]:
-            return response["result"][0]["rating"]
-        else:
-            return 0
+        return resp[1].get('rating', 0)
 
     async def get_first_name(self, handle):
-        url = f"https://codeforces.com/api/user.info?handles={handle}"
-        response = await self.api_response(url)
-        if not response or "firstName" not in response["result"][0]:
+        resp = await self.check_handle(handle)
+        if not resp[0]:
             return None
-        return response["result"][0]["firstName"]
+        return resp[1].get('firstName')
 
     async def get_user_info(self, handles):
         url = f"https://codeforces.com/api/user.info"
@@ -4,6 +4,8 @@ import traceback
 
 import aiohttp
 
+from constants import API_CONNECT_TIMEOUT, API_READ_TIMEOUT
+
 BASE_URL = "https://api.challonge.com/v1/"
 
 
@@ -16,7 +18,8 @@ class ChallongeAPI:
     async def api_response(self, method, url, params=None):
         try:
             headers = {'Content-Type': 'application/json'}
-            async with aiohttp.ClientSession() as session:
+            timeout = aiohttp.ClientTimeout(sock_connect=API_CONNECT_TIMEOUT, sock_read=API_READ_TIMEOUT)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
                 async with session.request(method, url, json=params, headers=headers) as resp:
                     response = await resp.json()
                     return response
@@ -0,0 +1,74 @@
+import logging
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold, reset_timeout, max_reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.timeout = reset_timeout
+        self.opened_at = 0
+        self.probe_started = None
+        self.rejected = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def _ready_to_probe(self):
+        return time.monotonic() >= self.opened_at + self.timeout
+
+    def available(self):
+        # True if a call made now would be let through, either normally or as the half-open probe
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return self._ready_to_probe()
+        return self.probe_started is None or time.monotonic() > self.probe_started + self.timeout
+
+    def allow(self):
+        if self.state == OPEN and self._ready_to_probe():
+            self.state = HALF_OPEN
+            self.probe_started = None
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and self.available():
+            # Let exactly one call through to find out whether the endpoint is back
+            self.probe_started = time.monotonic()
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        if self.state != CLOSED:
+            self.logger.info(f"{self.name} is reachable again, resuming requests")
+        self.state = CLOSED
+        self.failures = 0
+        self.timeout = self.reset_timeout
+        self.probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            # Probe failed, stay open and wait twice as long before the next one
+            self.timeout = min(self.timeout * 2, self.max_reset_timeout)
+        elif self.state == CLOSED and self.failures < self.failure_threshold:
+            return
+        if self.state == CLOSED:
+            self.logger.warning(f"{self.name} failed {self.failures} times in a row, pausing requests")
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.probe_started = None
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'retry_in': max(0, self.opened_at + self.timeout - time.monotonic()) if self.state != CLOSED else 0,
+            'rejected': self.rejected
+        }
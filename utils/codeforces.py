@@ -1,100 +1,199 @@
 import json
 import logging
-import math
-import random
+import os
+from collections import OrderedDict, namedtuple
+
+from constants import SOLVED_CACHE_SIZE
 
 from data import dbconn
-from utils import cf_api
+from utils import cf_api, rate_limiter
+from utils.problem_catalog import ProblemCatalog
 
 logger = logging.getLogger(__name__)
 db = dbconn.DbConn()
-cf = cf_api.CodeforcesAPI()
+# One client per rate limiter lane, callers say which lane their lookups belong to
+cf = {lane: cf_api.CodeforcesAPI(lane) for lane in rate_limiter.LANES}
+
+catalog = ProblemCatalog()
+
+# Written by scraper.run and copied to the problem_authors table, which every process reads from
+AUTHORS_FILE = './data/authors.json'
+# handle (lowercase) -> ids of the contests it authored, rebuilt when the stored authors are replaced
+author_index = {}
+authors_version = None
 
-authors = None
+SYNC_PAGE_SIZE = 100
+# handle -> [sync mark it reflects, set of solved (contest id, index)], kept up to date while parsing new submissions.
+# Least recently synced handles are dropped past SOLVED_CACHE_SIZE.
+solved_cache = OrderedDict()
 
 
-def isNonStandard(id):
+def isNonStandard(contest_name):
     names = [
         'wild', 'fools', 'unrated', 'surprise', 'unknown', 'friday', 'q#', 'testing',
         'marathon', 'kotlin', 'onsite', 'experimental', 'abbyy']
-    contest_name = db.get_contest_name(id)
     for x in names:
         if x in contest_name.lower():
             return True
     return False
 
 
-def isAuthor(handles, problem):
-    if str(problem.id) not in authors:
-        return False
-    for handle in handles:
-        if handle in authors[str(problem.id)]:
-            return True
-    return False
-
-
-def filter_problems(all_problems, user_problems, handles):
-    with open('./data/authors.json') as f:
-        global authors
-        authors = json.load(f)
-    unsolved = []
-    names = sorted([x.name for x in user_problems])
-
-    for problem in all_problems:
-        if isNonStandard(problem.id) or isAuthor(handles, problem):
-            continue
-
-        found = False
-        l, r = 0, len(names) - 1
-        while l <= r:
-            mid = int((l + r) / 2)
-            if names[mid] > problem.name:
-                r = mid - 1
-            elif names[mid] < problem.name:
-                l = mid + 1
-            else:
-                found = True
+def store_authors():
+    with open(AUTHORS_FILE) as f:
+        data = json.load(f)
+    db.set_problem_authors([(int(contest), handle) for contest, handles in data.items() for handle in handles])
+
+
+def load_authors():
+    global author_index, authors_version
+    version = db.get_problem_authors_version()
+    if version is None:
+        # Nothing stored yet, start from the file shipped with the bot
+        if not os.path.exists(AUTHORS_FILE):
+            logger.warning(f"{AUTHORS_FILE} not found, not excluding authored contests")
+            return
+        store_authors()
+        version = db.get_problem_authors_version()
+    if version == authors_version:
+        return
+    index = {}
+    for contest, handle in db.get_problem_authors():
+        index.setdefault(handle.lower(), set()).add(contest)
+    author_index, authors_version = index, version
+
+
+def authored_contests(handles):
+    load_authors()
+    return set().union(*[author_index.get(handle.lower(), set()) for handle in handles])
+
+
+def load_catalog():
+    # Contests stored before the eligible flag existed are checked by name until update_problemset sets it
+    eligible = set(x.id for x in db.get_contests() if (x.eligible if x.eligible is not None else
+                                                        not isNonStandard(x.name)))
+    catalog.load(db.get_problems(), eligible)
+    logger.info(f"Loaded {len(catalog.problems)} problems")
+
+
+# id = contest_id/index
+def get_problem(id):
+    if not catalog.loaded:
+        load_catalog()
+    contest, _, index = id.partition('/')
+    if not contest.isdigit():
+        return None
+    problem = catalog.get(contest, index)
+    if problem is None:
+        # Another process may have added it since the catalog was loaded, then the catalog is stale
+        stored = db.get_problems(id)
+        if not stored:
+            return None
+        load_catalog()
+        problem = stored[0]
+    return problem
+
+
+def is_final(submission):
+    return submission.get('verdict') not in [None, 'TESTING']
+
+
+async def sync_solved(handle, deadline=None, priority=rate_limiter.INTERACTIVE):
+    # Brings the stored solved problems of a handle up to date and returns how many were added. Only submissions
+    # newer than the stored high-water mark are fetched, the full history is pulled once the first time a handle is seen.
+    state = db.get_sync_state(handle)
+    last_id = state.last_id if state else None
+    # Another process may have synced the handle since it was cached, then the stored set is read again
+    if handle in solved_cache and solved_cache[handle][0] != last_id:
+        del solved_cache[handle]
+    if state is None:
+        resp = await cf[priority].get_user_submissions(handle, deadline=deadline)
+        if not resp[0]:
+            return resp
+        new = resp[1]
+    else:
+        new = []
+        start = 1
+        while True:
+            resp = await cf[priority].get_user_submissions(handle, start, SYNC_PAGE_SIZE, deadline)
+            if not resp[0]:
+                return resp
+            page = [x for x in resp[1] if x['id'] > state.last_id]
+            new.extend(page)
+            if len(page) < SYNC_PAGE_SIZE:
                 break
+            start += SYNC_PAGE_SIZE
 
-        if not found:
-            unsolved.append(problem)
-
-    return unsolved
-
-
-async def find_problems(handles, ratings):
-    all_problems = db.get_problems()
-    user_problems = []
+    first_ac = {}
+    for x in new:
+        problem = (x['problem'].get('contestId'), x['problem']['index'])
+        if x.get('verdict') != 'OK' or problem[0] is None:
+            continue
+        first_ac[problem] = min(first_ac.get(problem, x['creationTimeSeconds']), x['creationTimeSeconds'])
+    if first_ac:
+        db.add_solved_problems(handle, [(x[0], x[1], t) for x, t in first_ac.items()])
+
+    # Never move the mark past a submission that is still being judged, it has to be looked at again
+    pending = min([x['id'] for x in new if not is_final(x)], default=None)
+    done = [x for x in new if pending is None or x['id'] < pending]
+    if done:
+        last = max(done, key=lambda x: x['id'])
+        db.update_sync_state(handle, last['id'], last['creationTimeSeconds'])
+        last_id = last['id']
+
+    if handle in solved_cache:
+        solved_cache[handle][1].update(first_ac)
+    else:
+        solved_cache[handle] = [None, db.get_solved_problems([handle])]
+    solved_cache[handle][0] = last_id
+    solved_cache.move_to_end(handle)
+    while len(solved_cache) > SOLVED_CACHE_SIZE:
+        solved_cache.popitem(last=False)
+
+    return [True, len(first_ac)]
+
+
+async def find_problems(handles, ratings, deadline=None, priority=rate_limiter.INTERACTIVE):
+    if not catalog.loaded:
+        load_catalog()
+    solved = set()
     for handle in handles:
-        resp = await cf.get_user_problems(handle)
+        resp = await sync_solved(handle, deadline, priority)
         if not resp[0]:
             return resp
-        user_problems.extend(resp[1])
+        # Taken right away, the handle may be evicted while the others are synced
+        solved |= solved_cache[handle][1]
+
+    available = catalog.available(solved, authored_contests(handles))
+    # All the problems of one rating are drawn together so that they are different
+    selected = {}
+    for x in dict.fromkeys(ratings):
+        selected[x] = catalog.sample(x, ratings.count(x), available)
+        if selected[x] is None:
+            return [False, f"Not enough problems with rating {x} left!"]
 
-    user_problems = list(set(user_problems))
+    return [True, [selected[x].pop() for x in ratings]]
 
-    unsolved_problems = filter_problems(all_problems, user_problems, handles)
 
-    selected = []
-    for x in ratings:
-        problem = None
-        options = [p for p in unsolved_problems if p.rating == x and p not in selected]
-        weights = [int(p.id * math.sqrt(p.id)) for p in options]
-        if options:
-            problem = random.choices(options, weights, k=1)[0]
-        if not problem:
-            return [False, f"Not enough problems with rating {x} left!"]
-        selected.append(problem)
+SubmissionIndex = namedtuple('SubmissionIndex', 'solves last_time')
+
 
-    return [True, selected]
+def index_submissions(subs):
+    # subs: raw submission objects
+    # (contest id, problem index) -> [earliest OK time, any submission still judging], built once per fetch
+    solves = {}
+    last_time = 0
+    for x in subs:
+        entry = solves.setdefault((x['problem'].get('contestId'), x['problem']['index']), [1e18, False])
+        verdict = x.get('verdict')
+        if verdict == 'OK':
+            entry[0] = min(entry[0], x['creationTimeSeconds'])
+        if verdict is None or verdict == 'TESTING':
+            entry[1] = True
+        last_time = max(last_time, x['creationTimeSeconds'])
+    return SubmissionIndex(solves, last_time)
 
 
+# -1 while a submission is being judged, 1e18 if unsolved
 def get_solve_time(sub, id, index):
-    best = 1e18
-    for x in sub:
-        if x.id == int(id) and x.index == index:
-            if x.verdict == 'OK':
-                best = min(best, x.sub_time)
-            if x.verdict is None or x.verdict == 'TESTING':
-                return -1
-    return best
+    best, pending = sub.solves.get((int(id), index), (1e18, False))
+    return -1 if pending else best
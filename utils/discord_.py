@@ -9,7 +9,7 @@ from humanfriendly import format_timespan as timeez
 
 from constants import ADMIN_PRIVILEGE_ROLES, ALLOWED_CHANNEL, PREFIX
 from data import dbconn
-from utils import cf_api, updation
+from utils import cf_api, codeforces, updation
 from utils.updation import match_score, round_score
 
 logger = logging.getLogger(__name__)
@@ -104,8 +104,7 @@ async def get_alt_response(client, ctx, message, limit, time, author):
         if len(data) > limit or len(data) <= 0:
             return False
         handles = []
-        for i in data:
-            resp = await cf.check_handle((i))
+        for resp in await cf.check_handles(data):
             if not resp[0]:
                 return False
             handles.append(resp[1]['handle'])
@@ -140,14 +139,14 @@ async def get_problems_response(client, ctx, message, time, length, author):
             problem = i.split('/')
             if len(problem) != 2:
                 return False
-            if not db.get_problems(i.upper()):
+            if not codeforces.get_problem(i.upper()):
                 return False
         return True
 
     try:
         msg = await client.wait_for('message', timeout=time, check=check)
         await original.delete()
-        return [True, [db.get_problems(x.upper())[0] for x in msg.content.split()]]
+        return [True, [codeforces.get_problem(x.upper()) for x in msg.content.split()]]
     except asyncio.TimeoutError:
         await original.delete()
         return [False]
@@ -158,7 +157,7 @@ def match_problems_embed(match_info):
     problems = match_info.problems.split()
 
     points = [f"{100 * (i + 1)}" for i in range(5)]
-    names = [f"[{db.get_problems(problems[i])[0].name}](https://codeforces.com/contest/{problems[i].split('/')[0]}"
+    names = [f"[{codeforces.get_problem(problems[i]).name}](https://codeforces.com/contest/{problems[i].split('/')[0]}"
              f"/problem/{problems[i].split('/')[1]})" if match_info.status[i] == '0' else "This problem has been solved"
              for i in range(5)]
     rating = [f"{match_info.rating + i * 100}" for i in range(5)]
@@ -214,7 +213,7 @@ def round_problems_embed(round_info):
         map(int, round_info.status.split())), list(map(int, round_info.times.split())))
 
     problems = round_info.problems.split()
-    names = [f"[{db.get_problems(problems[i])[0].name}](https://codeforces.com/contest/{problems[i].split('/')[0]}"
+    names = [f"[{codeforces.get_problem(problems[i]).name}](https://codeforces.com/contest/{problems[i].split('/')[0]}"
              f"/problem/{problems[i].split('/')[1]})" if problems[i] != '0' else "This problem has been solved" if
              round_info.repeat == 0 else "No problems of this rating left" for i in range(len(problems))]
 
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import traceback
+
+
+class Stage:
+    # A bounded queue and the workers consuming it. Putting into a full queue waits, so a slow stage
+    # holds back the ones feeding it instead of piling up work.
+    # With key, items are spread over one queue per worker by key and items with the same key are
+    # handled one at a time, in the order they were put.
+    def __init__(self, name, handler, workers, max_size, key=None):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.max_size = max_size
+        self.key = key
+        self.queues = None
+        self.tasks = []
+        self.busy = 0
+        self.processed = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def start(self):
+        if self.queues is not None:
+            return
+        self.queues = [asyncio.Queue(self.max_size) for _ in range(self.workers if self.key else 1)]
+        for i in range(self.workers):
+            self.tasks.append(asyncio.ensure_future(self._work(self.queues[i % len(self.queues)])))
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+
+    async def put(self, item):
+        self.start()
+        queue = self.queues[hash(self.key(item)) % len(self.queues)] if self.key else self.queues[0]
+        await queue.put(item)
+        self.max_depth = max(self.max_depth, self.depth())
+
+    async def join(self):
+        if self.queues is None:
+            return
+        for queue in self.queues:
+            await queue.join()
+
+    async def _work(self, queue):
+        while True:
+            item = await queue.get()
+            self.busy += 1
+            try:
+                await self.handler(item)
+                self.processed += 1
+            except Exception:
+                self.errors += 1
+                self.logger.error(f"Error in {self.name} stage: {str(traceback.format_exc())}")
+            finally:
+                self.busy -= 1
+                queue.task_done()
+
+    def depth(self):
+        return sum(queue.qsize() for queue in self.queues) if self.queues else 0
+
+    def stats(self):
+        return {
+            'depth': self.depth(),
+            'max_depth': self.max_depth,
+            'capacity': self.max_size * (len(self.queues) if self.queues else 1),
+            'workers': self.workers,
+            'busy': self.busy,
+            'processed': self.processed,
+            'errors': self.errors
+        }
@@ -0,0 +1,76 @@
+import heapq
+
+from constants import POLL_EDGE_WINDOW, POLL_MAX_INTERVAL, POLL_MIN_INTERVAL
+
+
+class PollSchedule:
+    def __init__(self, min_interval, max_interval, edge_window):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.edge_window = edge_window
+        # key -> [due time, current interval], the heap may hold stale due times for a key which are skipped
+        self.entries = {}
+        self.heap = []
+
+    def _push(self, key, due, interval):
+        self.entries[key] = [due, interval]
+        heapq.heappush(self.heap, (due, key))
+
+    def sync(self, keys):
+        # Start tracking new matches/rounds, they are due right away. Forget the ones that are gone.
+        for key in keys:
+            if key not in self.entries:
+                self._push(key, 0, self.min_interval)
+        for key in [x for x in self.entries if x not in keys]:
+            del self.entries[key]
+        if len(self.heap) > 4 * len(self.entries) + 100:
+            self.heap = [(due, key) for key, (due, _) in self.entries.items()]
+            heapq.heapify(self.heap)
+
+    def pop_due(self, now):
+        # Keys whose poll is due, earliest first. Each one is pushed back min_interval ahead in case
+        # whoever polls it never reschedules it.
+        due, seen = [], set()
+        while self.heap and self.heap[0][0] <= now:
+            time_, key = heapq.heappop(self.heap)
+            if key not in self.entries or self.entries[key][0] != time_ or key in seen:
+                continue
+            due.append(key)
+            seen.add(key)
+        for key in due:
+            self._push(key, now + self.min_interval, self.entries[key][1])
+        return due
+
+    def retry(self, key, now):
+        # Not polled this time, keep it at the front of the queue
+        if key in self.entries:
+            self._push(key, now, self.entries[key][1])
+
+    def reschedule(self, key, start, duration, now, active, submitted):
+        # active: someone solved a problem or has a submission in queue
+        # submitted: anyone has submitted since the start
+        if key not in self.entries:
+            return
+        end = start + 60 * duration
+        if active or now - start < self.edge_window or end - now < self.edge_window:
+            interval = self.min_interval
+        elif not submitted:
+            interval = self.max_interval
+        else:
+            interval = min(self.entries[key][1] * 2, self.max_interval)
+        due = now + interval
+        if now < end:
+            # The poll right after the end decides the result, don't sleep through it
+            due = min(due, end + 1)
+        self._push(key, due, interval)
+
+    def stats(self, now):
+        intervals = [x[1] for x in self.entries.values()]
+        return {
+            'tracked': len(self.entries),
+            'due': len([x for x in self.entries.values() if x[0] <= now]),
+            'avg_interval': sum(intervals) / len(intervals) if intervals else 0
+        }
+
+
+schedule = PollSchedule(POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_EDGE_WINDOW)
@@ -0,0 +1,70 @@
+import numpy as np
+
+# Rounds of draws against the full rating bucket before falling back to drawing from the available problems only
+SAMPLE_ROUNDS = 3
+
+rng = np.random.default_rng()
+
+
+class ProblemCatalog:
+    # The problems table kept in memory, sorted by rating so that every rating is one slice of the columns
+    def __init__(self):
+        self.load([], set())
+        self.loaded = False
+
+    def load(self, problems, eligible):
+        problems = sorted(problems, key=lambda x: (x.rating, x.id, x.index))
+        by_id = {(x.id, x.index): i for i, x in enumerate(problems)}
+        ids = np.array([x.id for x in problems], dtype=np.int64)
+        ratings = np.array([x.rating for x in problems], dtype=np.int64)
+        # Newer contests are more likely to be picked
+        weights = np.floor(ids * np.sqrt(ids))
+        bucket_ratings, starts = np.unique(ratings, return_index=True)
+        ends = np.append(starts[1:], len(problems))
+        buckets = {int(x): (int(start), int(end)) for x, start, end in zip(bucket_ratings, starts, ends)}
+        cumulative = {x: np.cumsum(weights[start:end]) for x, (start, end) in buckets.items()}
+
+        # Swapped in at once so that a selection running during a reload sees either catalog, never a mix
+        self.problems, self.by_id, self.ids, self.ratings, self.weights = problems, by_id, ids, ratings, weights
+        self.is_eligible = np.isin(ids, list(eligible))
+        self.buckets, self.cumulative = buckets, cumulative
+        self.loaded = True
+
+    def get(self, id, index):
+        position = self.by_id.get((int(id), index))
+        return None if position is None else self.problems[position]
+
+    def available(self, solved, authored):
+        # Boolean mask over the catalog, solved: set of (contest id, index), authored: set of contest ids
+        mask = self.is_eligible.copy()
+        if authored:
+            mask &= ~np.isin(self.ids, list(authored))
+        mask[[self.by_id[x] for x in solved if x in self.by_id]] = False
+        return mask
+
+    def sample(self, rating, k, available):
+        # k different problems of the rating picked by weight among the available ones, None if there are fewer
+        if rating not in self.buckets:
+            return None
+        start, end = self.buckets[rating]
+        free = available[start:end]
+        if np.count_nonzero(free) < k:
+            return None
+
+        # Draws over the whole bucket using its precomputed cumulative weights, rejecting unavailable and
+        # repeated problems. Usually only a few problems of a rating are excluded and this is done in one round.
+        cumulative = self.cumulative[rating]
+        chosen = np.empty(0, dtype=np.int64)
+        for _ in range(SAMPLE_ROUNDS):
+            draws = np.searchsorted(cumulative, rng.random(2 * k) * cumulative[-1], side='right')
+            draws = draws[free[draws] & ~np.isin(draws, chosen)]
+            # Each problem once, in the order it was first drawn
+            _, first = np.unique(draws, return_index=True)
+            chosen = np.concatenate([chosen, draws[np.sort(first)]])[:k]
+            if len(chosen) == k:
+                return [self.problems[start + x] for x in chosen]
+
+        weights = np.where(free, self.weights[start:end], 0)
+        weights[chosen] = 0
+        rest = rng.choice(end - start, size=k - len(chosen), replace=False, p=weights / weights.sum())
+        return [self.problems[start + x] for x in np.concatenate([chosen, rest])]
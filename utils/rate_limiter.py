@@ -0,0 +1,107 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+# Priority classes, lower value is served first
+INTERACTIVE = 0
+POLLING = 1
+BULK = 2
+
+LANES = {INTERACTIVE: 'interactive', POLLING: 'polling', BULK: 'bulk'}
+
+
+class RequestScheduler:
+    def __init__(self, rate, capacity, bulk_reserve=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.bulk_reserve = bulk_reserve
+        # Tokens that must be left in the bucket after a lane takes one. Bulk jobs keep one spare so an
+        # interactive command arriving right after them never has to wait for a refill.
+        self.reserve = {INTERACTIVE: 0, POLLING: 0, BULK: min(bulk_reserve, capacity - 1)}
+        self.queue = []
+        self.counter = itertools.count()
+        self.wakeup = None
+        self.dispatcher = None
+        self.lane_stats = {lane: {'acquired': 0, 'delayed': 0, 'total_wait': 0, 'max_wait': 0} for lane in LANES}
+
+    def set_rate(self, rate, capacity):
+        if (rate, capacity) == (self.rate, self.capacity):
+            return
+        self._refill()
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = min(self.tokens, capacity)
+        self.reserve[BULK] = min(self.bulk_reserve, capacity - 1)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _available(self, priority):
+        return self.tokens >= 1 + self.reserve[priority]
+
+    async def acquire(self, priority=INTERACTIVE):
+        start = time.monotonic()
+        self._refill()
+        if (not self.queue or self.queue[0][0] > priority) and self._available(priority):
+            self.tokens -= 1
+        else:
+            future = asyncio.get_event_loop().create_future()
+            heapq.heappush(self.queue, (priority, next(self.counter), future))
+            self._wake()
+            await future
+
+        wait = time.monotonic() - start
+        stats = self.lane_stats[priority]
+        stats['acquired'] += 1
+        if wait > 0.001:
+            stats['delayed'] += 1
+        stats['total_wait'] += wait
+        stats['max_wait'] = max(stats['max_wait'], wait)
+
+    def _wake(self):
+        if self.dispatcher is None or self.dispatcher.done():
+            self.wakeup = asyncio.Event()
+            self.dispatcher = asyncio.ensure_future(self._dispatch())
+        else:
+            self.wakeup.set()
+
+    async def _dispatch(self):
+        while self.queue:
+            priority, _, future = self.queue[0]
+            if future.done():
+                # The caller was cancelled while waiting
+                heapq.heappop(self.queue)
+                continue
+            self._refill()
+            if self._available(priority):
+                heapq.heappop(self.queue)
+                self.tokens -= 1
+                future.set_result(None)
+                continue
+            # Sleep until the head of the queue can be served, or until a higher priority caller shows up
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), (1 + self.reserve[priority] - self.tokens) / self.rate)
+            except asyncio.TimeoutError:
+                pass
+
+    def queue_depth(self, priority=None):
+        return len([x for x in self.queue if not x[2].done() and (priority is None or x[0] == priority)])
+
+    def stats(self):
+        res = {}
+        for lane, name in LANES.items():
+            stats = self.lane_stats[lane]
+            res[name] = {
+                'queue_depth': self.queue_depth(lane),
+                'acquired': stats['acquired'],
+                'delayed': stats['delayed'],
+                'avg_wait': stats['total_wait'] / stats['acquired'] if stats['acquired'] else 0,
+                'max_wait': stats['max_wait']
+            }
+        return res
@@ -1,6 +1,8 @@
 import asyncio
+import functools
 import logging
 import os
+import socket
 import time
 import traceback
 from datetime import date
@@ -8,165 +10,347 @@ from operator import itemgetter
 
 import discord
 
-from constants import BACKUP_DIR, PREFIX
+from constants import (AUTO_UPDATE_TIME, BACKUP_DIR, NOTIFY_WORKERS,
+                       PIPELINE_QUEUE_SIZE, PREFIX, TICK_DEADLINE,
+                       UPDATE_CONCURRENCY, WORK_LEASE_TIME)
 from data import dbconn
-from utils import (cf_api, challonge_api, discord_, elo, scraper,
-                   tournament_helper, updation)
+from utils import (cf_api, challonge_api, codeforces, discord_, elo,
+                   rate_limiter, scraper, tournament_helper, updation)
+from utils.pipeline import Stage
+from utils.poll_schedule import schedule
+from utils.tick_runner import TickRunner
 
 logger = logging.getLogger(__name__)
 db = dbconn.DbConn()
-cf = cf_api.CodeforcesAPI()
+# Only used by the rating and problemset crons, which can wait for spare capacity
+cf = cf_api.CodeforcesAPI(rate_limiter.BULK)
 api = None
 
-
-async def update_matches(client):
-    matches = db.get_all_matches()
-    for match in matches:
+# Identifies this process in the work_leases table
+HOST = socket.gethostname()
+WORKER_ID = f"{HOST}:{os.getpid()}"
+update_runner = TickRunner('update', AUTO_UPDATE_TIME, TICK_DEADLINE)
+# Advisory lock (CRON_LOCK_CLASS, n) elects the process that runs cron job n
+CRON_LOCK_CLASS = 5010
+cron_locks = {'create_backup': 1, 'update_ratings': 2, 'update_problemset': 3, 'scrape_authors': 4}
+held_cron_locks = set()
+tick_stats = {'deadline_hits': 0, 'deferred_matches': 0, 'deferred_rounds': 0}
+# Keys of the matches and rounds between being polled and having their changes written
+in_flight = set()
+# Finished tournament rounds of a guild are reported one at a time
+tournament_locks = {}
+
+
+async def update(client, deadline=None):
+    if not cf_api.is_available('user.status'):
+        logger.debug("Skipping updates, Codeforces is unavailable")
+        return 0, 0
+    items = {match_key(x): x for x in db.get_all_matches()}
+    items.update({round_key(x): x for x in db.get_all_rounds()})
+    # Other bot processes may be running updates too, only the items this one holds a lease on are its to poll
+    claimed = db.claim_work_items(WORKER_ID, [work_item(key) for key in items], WORK_LEASE_TIME)
+    items = {key: x for key, x in items.items() if work_item(key) in claimed}
+    schedule.sync(items)
+    cf_api.share_rate_limit(len([x for x in db.get_live_workers() if x.rpartition(':')[0] == HOST]))
+
+    # Only matches and rounds whose poll is due, the ones waiting longest (or carried over) first. The ones
+    # still going through the pipeline wait, what an earlier poll found in them may not be written yet.
+    enter_time = time.time()
+    due, busy = [], []
+    for key in schedule.pop_due(enter_time):
+        (busy if key in in_flight else due).append(key)
+    for key in busy:
+        schedule.retry(key, enter_time)
+    if not due:
+        return 0, len(busy)
+    in_flight.update(due)
+    # Waits only if the previous poll hasn't started yet, detecting and writing happen in their own stages
+    await poller.put((client, {key: items[key] for key in due}, enter_time,
+                      None if deadline is None else deadline - time.monotonic()))
+    return len(due), len(busy)
+
+
+async def poll(event):
+    # Polls the handles of a batch of due matches and rounds together, budget: seconds it may take
+    client, items, enter_time, budget = event
+    deadline = None if budget is None else time.monotonic() + budget
+    handed = set()
+    try:
+        item_handles = {key: updation.match_handles(info) if key[0] == 'match' else
+                        updation.round_handles(info) for key, info in items.items()}
+        handles, contests = {}, {}
+        for key, info in items.items():
+            for handle in item_handles[key]:
+                handles[handle] = min(handles.get(handle, info.time), info.time)
+                contests.setdefault(handle, set()).update(updation.item_contests(info))
+
+        subs = await updation.poll_handles(handles, contests, deadline)
+        if len(subs) < len(handles) and not cf_api.is_closed('user.status'):
+            logger.debug(f"Codeforces is unavailable, {len(handles) - len(subs)} handles left to poll")
+        elif len(subs) < len(handles):
+            tick_stats['deadline_hits'] += 1
+            logger.info(f"Update deadline reached, {len(handles) - len(subs)} handles left to poll")
+
+        for key, info in items.items():
+            if not all(handle in subs for handle in item_handles[key]):
+                schedule.retry(key, enter_time)
+                tick_stats['deferred_matches' if key[0] == 'match' else 'deferred_rounds'] += 1
+            else:
+                await detector.put((client, key, info, item_handles[key], subs, enter_time))
+                handed.add(key)
+    finally:
+        in_flight.difference_update(set(items) - handed)
+
+
+def singleton(job):
+    # Every process schedules the cron jobs, only the one holding the job's advisory lock runs them. The lock
+    # stays with it until its database connection goes away, then the next process to try takes over.
+    @functools.wraps(job)
+    async def run(*args):
+        name = job.__name__
+        if name not in held_cron_locks:
+            if not db.try_advisory_lock(CRON_LOCK_CLASS, cron_locks[name]):
+                logger.debug(f"Skipping {name}, another process holds its lock")
+                return
+            logger.info(f"Took over {name}")
+            held_cron_locks.add(name)
+        await job(*args)
+    return run
+
+
+def cron_leaders():
+    holders = db.get_advisory_lock_holders(CRON_LOCK_CLASS)
+    return {name: holders.get(key) for name, key in cron_locks.items()}
+
+
+def match_key(match_info):
+    return 'match', match_info.guild, match_info.p1_id
+
+
+def round_key(round_info):
+    return 'round', round_info.guild, round_info.users
+
+
+def work_item(key):
+    return ':'.join(map(str, key))
+
+
+def reschedule(key, info, handles, subs, resp):
+    # resp: updates, over, _, judging
+    active = any(len(x) > 0 for x in resp[0]) or resp[3]
+    schedule.reschedule(key, info.time, info.duration, time.time(), active,
+                        updation.submitted_since(subs, handles, info.time))
+
+
+async def detect(event):
+    # Works out what changed in a polled match or round
+    client, key, info, handles, subs, enter_time = event
+    handed = False
+    try:
+        kind = 'matches' if key[0] == 'match' else 'rounds'
         try:
-            # updates, over, match_status
-            guild = client.get_guild(match.guild)
-            resp = await updation.update_match(match)
-            if not resp[0]:
-                logger.error(f"Error while updating matches: {resp[1]}")
-                continue
-            resp = resp[1]
-            channel = client.get_channel(match.channel)
-            if resp[1] or len(resp[0]) > 0:
-                mem1, mem2 = await discord_.fetch_member(guild, match.p1_id), \
-                    await discord_.fetch_member(guild, match.p2_id)
-                await channel.send(
-                    f"{mem1.mention} {mem2.mention}, there is an update in standings!")
-
-            for x in resp[0]:
-                await channel.send(embed=discord.Embed(
-                    description=f"{' '.join([(await discord_.fetch_member(guild, m)).mention for m in x[1]])} has solved problem worth {x[0] * 100} points",
-                    color=discord.Color.blue()))
-
-            if not resp[1] and len(resp[0]) > 0:
-                await channel.send(
-                    embed=discord_.match_problems_embed(db.get_match_info(guild.id, match.p1_id)))
-
-            if resp[1]:
-                a, b = updation.match_score(resp[2])
-                p1_rank, p2_rank = 1 if a >= b else 2, 1 if b >= a else 2
-                ranklist = []
-                ranklist.append([await discord_.fetch_member(guild, match.p1_id), p1_rank,
-                                 db.get_match_rating(guild.id, match.p1_id)[-1]])
-                ranklist.append([await discord_.fetch_member(guild, match.p2_id), p2_rank,
-                                 db.get_match_rating(guild.id, match.p2_id)[-1]])
-                ranklist = sorted(ranklist, key=itemgetter(1))
-                res = elo.calculateChanges(ranklist)
-
-                db.add_rating_update(guild.id, match.p1_id, res[match.p1_id][0])
-                db.add_rating_update(guild.id, match.p2_id, res[match.p2_id][0])
-                db.delete_match(match.guild, match.p1_id)
-                db.add_to_finished(match, resp[2])
-
-                embed = discord.Embed(color=discord.Color.dark_magenta())
-                pos, name, ratingChange = '', '', ''
-                for user in ranklist:
-                    pos += f"{':first_place:' if user[1] == 1 else ':second_place:'}\n"
-                    name += f"{user[0].mention}\n"
-                    ratingChange += f"{res[user[0].id][0]} (**{'+' if res[user[0].id][1] >= 0 else ''}{res[user[0].id][1]}**)\n"
-                embed.add_field(name="Position", value=pos)
-                embed.add_field(name="User", value=name)
-                embed.add_field(name="Rating changes", value=ratingChange)
-                embed.set_author(name=f"Match over! Final standings\nScore: {a}-{b}")
-                await channel.send(embed=embed)
-        except Exception:
-            logger.error(f"Error while updating matches: {str(traceback.format_exc())}")
-
-
-async def update_rounds(client):
-    rounds = db.get_all_rounds()
+            if key[0] == 'match':
+                resp = await updation.update_match(info, handles, subs, enter_time)
+            else:
+                resp = await updation.update_round(info, handles, subs, enter_time)
+        except cf_api.DeadlineExceeded:
+            schedule.retry(key, time.time())
+            tick_stats['deadline_hits'] += 1
+            tick_stats['deferred_rounds'] += 1
+            logger.info(f"Update deadline reached, round in guild {info.guild} carried over to the next update")
+            return
+        except cf_api.CircuitOpen:
+            schedule.retry(key, time.time())
+            tick_stats['deferred_rounds'] += 1
+            logger.debug(f"Codeforces is unavailable, round in guild {info.guild} carried over to the next update")
+            return
+        if not resp[0]:
+            logger.error(f"Error while updating {kind}: {resp[1]}")
+            return
+        resp = resp[1]
+        reschedule(key, info, handles, subs, resp)
+        # updates, over, match_status / updates, over, updated
+        if resp[1] or (len(resp[0]) > 0 if key[0] == 'match' else resp[2]):
+            await writer.put((client, key, info, resp))
+            handed = True
+    finally:
+        if not handed:
+            in_flight.discard(key)
+
+
+async def write(event):
+    # Stores the changes, the notifier only talks to Discord
+    client, key, info, resp = event
+    try:
+        if not db.holds_work_item(WORKER_ID, work_item(key)):
+            # The lease ran out while this was being worked on and another process may have taken over
+            logger.warning(f"Lost the lease on {work_item(key)}, dropping its update")
+            return
+        result = write_match(info, resp) if key[0] == 'match' else write_round(info, resp)
+    finally:
+        in_flight.discard(key)
+    await notifier.put((client, key, info, resp, result))
+
+
+def write_match(match, resp):
+    if len(resp[0]) > 0:
+        db.update_match_status(match, resp[2])
+    if not resp[1]:
+        return db.get_match_info(match.guild, match.p1_id)
+
+    a, b = updation.match_score(resp[2])
+    p1_rank, p2_rank = 1 if a >= b else 2, 1 if b >= a else 2
+    ranklist = []
+    ranklist.append([discord.Object(match.p1_id), p1_rank, db.get_match_rating(match.guild, match.p1_id)[-1]])
+    ranklist.append([discord.Object(match.p2_id), p2_rank, db.get_match_rating(match.guild, match.p2_id)[-1]])
+    ranklist = sorted(ranklist, key=itemgetter(1))
+    res = elo.calculateChanges(ranklist)
+
+    db.add_rating_update(match.guild, match.p1_id, res[match.p1_id][0])
+    db.add_rating_update(match.guild, match.p2_id, res[match.p2_id][0])
+    db.delete_match(match.guild, match.p1_id)
+    db.add_to_finished(match, resp[2])
+    return [a, b, [[user[0].id, user[1]] for user in ranklist], res]
+
+
+def write_round(round, resp):
+    users = list(map(int, round.users.split()))
+    if resp[2]:
+        db.update_round_status(round.guild, users[0], *resp[4])
+    round_info = db.get_round_info(round.guild, round.users)
+    if not resp[1]:
+        return round_info
+
+    ranklist = updation.round_score(users, list(map(int, round_info.status.split())),
+                                    list(map(int, round_info.times.split())))
+    eloChanges = elo.calculateChanges([[discord.Object(user.id), user.rank,
+                                        db.get_match_rating(round_info.guild, user.id)[-1]] for user in ranklist])
+
+    for id in users:
+        db.add_rating_update(round_info.guild, id, eloChanges[id][0])
+
+    db.delete_round(round_info.guild, round_info.users)
+    db.add_to_finished_rounds(round_info)
+    handles = {user.id: db.get_handle(round_info.guild, user.id) for user in ranklist}
+    return [round_info, ranklist, eloChanges, handles]
+
+
+async def notify(event):
+    client, key, info, resp, result = event
+    if key[0] == 'match':
+        await notify_match(client, info, resp, result)
+    else:
+        await notify_round(client, info, resp, result)
+
+
+async def notify_match(client, match, resp, result):
+    guild = client.get_guild(match.guild)
+    channel = client.get_channel(match.channel)
+    mem1, mem2 = await discord_.fetch_member(guild, match.p1_id), \
+        await discord_.fetch_member(guild, match.p2_id)
+    await channel.send(
+        f"{mem1.mention} {mem2.mention}, there is an update in standings!")
+
+    for x in resp[0]:
+        await channel.send(embed=discord.Embed(
+            description=f"{' '.join([(await discord_.fetch_member(guild, m)).mention for m in x[1]])} has solved problem worth {x[0] * 100} points",
+            color=discord.Color.blue()))
+
+    if not resp[1]:
+        await channel.send(embed=discord_.match_problems_embed(result))
+        return
+
+    a, b, ranklist, res = result
+    embed = discord.Embed(color=discord.Color.dark_magenta())
+    pos, name, ratingChange = '', '', ''
+    for id, rank in ranklist:
+        pos += f"{':first_place:' if rank == 1 else ':second_place:'}\n"
+        name += f"{(await discord_.fetch_member(guild, id)).mention}\n"
+        ratingChange += f"{res[id][0]} (**{'+' if res[id][1] >= 0 else ''}{res[id][1]}**)\n"
+    embed.add_field(name="Position", value=pos)
+    embed.add_field(name="User", value=name)
+    embed.add_field(name="Rating changes", value=ratingChange)
+    embed.set_author(name=f"Match over! Final standings\nScore: {a}-{b}")
+    await channel.send(embed=embed)
+
+
+async def notify_round(client, round, resp, result):
     global api
-    if api is None:
-        api = challonge_api.ChallongeAPI(client)
-    for round in rounds:
-        try:
-            guild = client.get_guild(round.guild)
-            resp = await updation.update_round(round)
-            if not resp[0]:
-                logger.error(f"Error while updating rounds: {resp[1]}")
-                continue
-            resp = resp[1]
-            channel = client.get_channel(round.channel)
-
-            if resp[2] or resp[1]:
-                await channel.send(
-                    f"{' '.join([(await discord_.fetch_member(guild, int(m))).mention for m in round.users.split()])} there is an update in standings")
-
-            for i in range(len(resp[0])):
-                if len(resp[0][i]):
-                    await channel.send(embed=discord.Embed(
-                        description=f"{' '.join([(await discord_.fetch_member(guild, m)).mention for m in resp[0][i]])} has solved problem worth **{round.points.split()[i]}** points",
-                        color=discord.Color.blue()))
-
-            if not resp[1] and resp[2]:
-                new_info = db.get_round_info(round.guild, round.users)
-                await channel.send(embed=discord_.round_problems_embed(new_info))
-
-            if resp[1]:
-                round_info = db.get_round_info(round.guild, round.users)
-                ranklist = updation.round_score(list(map(int, round_info.users.split())),
-                                                list(map(int, round_info.status.split())),
-                                                list(map(int, round_info.times.split())))
-                eloChanges = elo.calculateChanges([[(await discord_.fetch_member(guild, user.id)), user.rank,
-                                                    db.get_match_rating(round_info.guild, user.id)[-1]] for user in
-                                                   ranklist])
-
-                for id in list(map(int, round_info.users.split())):
-                    db.add_rating_update(round_info.guild, id, eloChanges[id][0])
-
-                db.delete_round(round_info.guild, round_info.users)
-                db.add_to_finished_rounds(round_info)
-
-                embed = discord.Embed(color=discord.Color.dark_magenta())
-                pos, name, ratingChange = '', '', ''
-                for user in ranklist:
-                    handle = db.get_handle(round_info.guild, user.id)
-                    emojis = [":first_place:", ":second_place:", ":third_place:"]
-                    pos += f"{emojis[user.rank - 1] if user.rank <= len(emojis) else str(user.rank)} **{user.points}**\n"
-                    name += f"[{handle}](https://codeforces.com/profile/{handle})\n"
-                    ratingChange += f"{eloChanges[user.id][0]} (**{'+' if eloChanges[user.id][1] >= 0 else ''}{eloChanges[user.id][1]}**)\n"
-                embed.add_field(name="Position", value=pos)
-                embed.add_field(name="User", value=name)
-                embed.add_field(name="Rating changes", value=ratingChange)
-                embed.set_author(name=f"Round over! Final standings")
-                await channel.send(embed=embed)
-
-                if round_info.tournament == 1:
-                    tournament_info = db.get_tournament_info(round_info.guild)
-                    if not tournament_info or tournament_info.status != 2:
-                        continue
-                    if ranklist[1].rank == 1 and tournament_info.type != 2:
-                        await discord_.send_message(channel, "Since the round ended in a draw, you will have to compete again for it to be counted in the tournament")
-                    else:
-                        res = await tournament_helper.validate_match(round_info.guild, ranklist[0].id, ranklist[1].id, api, db)
-                        if not res[0]:
-                            await discord_.send_message(channel, res[1] + f"\n\nIf you think this is a mistake, type `{PREFIX}tournament forcewin <handle>` to grant victory to a user")
-                        else:
-                            draw = True if ranklist[1].rank == 1 else False
-                            scores = f"{ranklist[0].points}-{ranklist[1].points}" if res[1]['player1'] == res[1][ranklist[0]
-                                                                                                                 .id] else f"{ranklist[1].points}-{ranklist[0].points}"
-                            match_resp = await api.post_match_results(res[1]['tournament_id'], res[1]['match_id'], scores, res[1][ranklist[0].id] if not draw else "tie")
-                            if not match_resp or 'errors' in match_resp:
-                                await discord_.send_message(channel, f"Some error occurred while validating tournament match. \n\nType `{PREFIX}tournament forcewin <handle>` to grant victory to a user manually")
-                                if match_resp and 'errors' in match_resp:
-                                    logger.error(f"Error while validating tournament rounds: {match_resp['errors']}")
-                                continue
-                            winner_handle = db.get_handle(round_info.guild, ranklist[0].id)
-                            await discord_.send_message(channel, f"{f'Congrats **{winner_handle}** for qualifying to the next round. :tada:' if not draw else 'The round ended in a draw!'}\n\nTo view the list of future tournament rounds, type `{PREFIX}tournament matches`")
-                            if await tournament_helper.validate_tournament_completion(round_info.guild, api, db):
-                                await api.finish_tournament(res[1]['tournament_id'])
-                                await asyncio.sleep(3)
-                                winner_handle = await tournament_helper.get_winner(res[1]['tournament_id'], api)
-                                await channel.send(embed=tournament_helper.tournament_over_embed(round_info.guild, winner_handle, db))
-                                db.add_to_finished_tournaments(db.get_tournament_info(round_info.guild), winner_handle)
-                                db.delete_tournament(round_info.guild)
-
-        except Exception:
-            logger.error(f"Error while updating rounds: {str(traceback.format_exc())}")
+    guild = client.get_guild(round.guild)
+    channel = client.get_channel(round.channel)
+    await channel.send(
+        f"{' '.join([(await discord_.fetch_member(guild, int(m))).mention for m in round.users.split()])} there is an update in standings")
+
+    for i in range(len(resp[0])):
+        if len(resp[0][i]):
+            await channel.send(embed=discord.Embed(
+                description=f"{' '.join([(await discord_.fetch_member(guild, m)).mention for m in resp[0][i]])} has solved problem worth **{round.points.split()[i]}** points",
+                color=discord.Color.blue()))
+
+    if not resp[1]:
+        await channel.send(embed=discord_.round_problems_embed(result))
+        return
+
+    round_info, ranklist, eloChanges, handles = result
+    embed = discord.Embed(color=discord.Color.dark_magenta())
+    pos, name, ratingChange = '', '', ''
+    for user in ranklist:
+        handle = handles[user.id]
+        emojis = [":first_place:", ":second_place:", ":third_place:"]
+        pos += f"{emojis[user.rank - 1] if user.rank <= len(emojis) else str(user.rank)} **{user.points}**\n"
+        name += f"[{handle}](https://codeforces.com/profile/{handle})\n"
+        ratingChange += f"{eloChanges[user.id][0]} (**{'+' if eloChanges[user.id][1] >= 0 else ''}{eloChanges[user.id][1]}**)\n"
+    embed.add_field(name="Position", value=pos)
+    embed.add_field(name="User", value=name)
+    embed.add_field(name="Rating changes", value=ratingChange)
+    embed.set_author(name=f"Round over! Final standings")
+    await channel.send(embed=embed)
+
+    if round_info.tournament == 1:
+        if api is None:
+            api = challonge_api.ChallongeAPI(client)
+        async with tournament_locks.setdefault(round_info.guild, asyncio.Lock()):
+            await update_tournament(channel, round_info, ranklist)
+
+
+# update -> poll -> detect -> write -> notify. Notifications of one channel are sent in order by the same worker.
+# One poll runs at a time and at most one more waits for it, the rate limiter is what bounds polling anyway.
+poller = Stage('poll', poll, 1, 1)
+detector = Stage('detect', detect, UPDATE_CONCURRENCY, PIPELINE_QUEUE_SIZE)
+writer = Stage('write', write, 1, PIPELINE_QUEUE_SIZE)
+notifier = Stage('notify', notify, NOTIFY_WORKERS, PIPELINE_QUEUE_SIZE, key=lambda event: event[2].channel)
+stages = [poller, detector, writer, notifier]
+
+
+async def update_tournament(channel, round_info, ranklist):
+    tournament_info = db.get_tournament_info(round_info.guild)
+    if not tournament_info or tournament_info.status != 2:
+        return
+    if ranklist[1].rank == 1 and tournament_info.type != 2:
+        await discord_.send_message(channel, "Since the round ended in a draw, you will have to compete again for it to be counted in the tournament")
+    else:
+        res = await tournament_helper.validate_match(round_info.guild, ranklist[0].id, ranklist[1].id, api, db)
+        if not res[0]:
+            await discord_.send_message(channel, res[1] + f"\n\nIf you think this is a mistake, type `{PREFIX}tournament forcewin <handle>` to grant victory to a user")
+        else:
+            draw = True if ranklist[1].rank == 1 else False
+            scores = f"{ranklist[0].points}-{ranklist[1].points}" if res[1]['player1'] == res[1][ranklist[0]
+                                                                                                 .id] else f"{ranklist[1].points}-{ranklist[0].points}"
+            match_resp = await api.post_match_results(res[1]['tournament_id'], res[1]['match_id'], scores, res[1][ranklist[0].id] if not draw else "tie")
+            if not match_resp or 'errors' in match_resp:
+                await discord_.send_message(channel, f"Some error occurred while validating tournament match. \n\nType `{PREFIX}tournament forcewin <handle>` to grant victory to a user manually")
+                if match_resp and 'errors' in match_resp:
+                    logger.error(f"Error while validating tournament rounds: {match_resp['errors']}")
+                return
+            winner_handle = db.get_handle(round_info.guild, ranklist[0].id)
+            await discord_.send_message(channel, f"{f'Congrats **{winner_handle}** for qualifying to the next round. :tada:' if not draw else 'The round ended in a draw!'}\n\nTo view the list of future tournament rounds, type `{PREFIX}tournament matches`")
+            if await tournament_helper.validate_tournament_completion(round_info.guild, api, db):
+                await api.finish_tournament(res[1]['tournament_id'])
+                await asyncio.sleep(3)
+                winner_handle = await tournament_helper.get_winner(res[1]['tournament_id'], api)
+                await channel.send(embed=tournament_helper.tournament_over_embed(round_info.guild, winner_handle, db))
+                db.add_to_finished_tournaments(db.get_tournament_info(round_info.guild), winner_handle)
+                db.delete_tournament(round_info.guild)
 
 
 async def create_backup(client):
@@ -186,62 +370,34 @@ async def update_ratings(client):
         handles = [x[2] for x in db.get_all_handles()]
         handles = list(set(handles))
 
-        CHAR_LIMIT = 3000
-
-        segments = []
-        curr = []
-        c = 0
-
-        for handle in handles:
-            if len(handle) + c > CHAR_LIMIT:
-                segments.append(curr)
-                curr = []
-                c = 0
-            curr.append(handle)
-            c += len(handle)
-
-        segments.append(curr)
-
-        for segment in segments:
-            data = await cf.get_user_info({'handles': ';'.join(segment)})
-            for user in data:
-                db.update_cf_rating(user['handle'], user['rating'] if 'rating' in user else 0)
+        for handle, resp in zip(handles, await cf.check_handles(handles)):
+            if resp[0]:
+                db.update_cf_rating(handle, resp[1].get('rating', 0))
 
     except Exception:
         logger.error(f"Error while updating ratings: {str(traceback.format_exc())}")
 
 
-def isNonStandard(contest_name):
-    names = [
-        'wild', 'fools', 'unrated', 'surprise', 'unknown', 'friday', 'q#', 'testing',
-        'marathon', 'kotlin', 'onsite', 'experimental', 'abbyy']
-    for x in names:
-        if x in contest_name.lower():
-            return True
-    return False
-
-
 async def update_problemset(client):
     contest_id = [x[0] for x in db.get_contests_id()]
     problem_id = [x.id for x in db.get_problems()]
     contest_list = await cf.get_contest_list()
     problem_list = await cf.get_problem_list()
 
-    mapping = {}
+    # Eligibility is decided here once, filtering problems only checks the stored flag
+    eligible = {}
 
     con_cnt, prob_cnt = 0, 0
 
     try:
         for contest in contest_list:
-            mapping[contest['id']] = contest['name']
-            if contest['id'] not in contest_id and contest['phase'] == "FINISHED" and not isNonStandard(
-                    contest['name']):
+            eligible[contest['id']] = not codeforces.isNonStandard(contest['name'])
+            if contest['id'] not in contest_id and contest['phase'] == "FINISHED" and eligible[contest['id']]:
                 con_cnt += 1
-                db.add_contest(contest['id'], contest['name'])
+                db.add_contest(contest['id'], contest['name'], eligible[contest['id']])
 
         for problem in problem_list:
-            if problem['contestId'] in mapping and not isNonStandard(
-                    mapping[problem['contestId']]) and 'rating' in problem and problem['contestId'] not in problem_id:
+            if eligible.get(problem['contestId']) and 'rating' in problem and problem['contestId'] not in problem_id:
                 prob_cnt += 1
                 db.add_problem(
                     problem['contestId'],
@@ -250,12 +406,24 @@ async def update_problemset(client):
                     problem['type'],
                     problem['rating'])
 
+        # Contests stored before the flag existed get it once
+        flags = [(x.id, not codeforces.isNonStandard(x.name)) for x in db.get_contests(unflagged=True)]
+        if flags:
+            db.set_contest_eligibility(flags)
+
     except Exception:
         logger.error(f"Error while updating problemset: {str(traceback.format_exc())}")
+    codeforces.load_catalog()
+
+
+async def reload_catalog(client):
+    codeforces.load_catalog()
 
 
 async def scrape_authors(client):
     try:
         scraper.run()
+        codeforces.store_authors()
+        codeforces.load_authors()
     except Exception:
         logger.error(f"Error while scraping {str(traceback.format_exc())}")
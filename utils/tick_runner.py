@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+import traceback
+
+
+class TickRunner:
+    # Runs a job every interval seconds, one run at a time. Ticks missed while a run overran are
+    # coalesced into a single run that starts as soon as the previous one ends.
+    def __init__(self, name, interval, deadline):
+        self.name = name
+        self.interval = interval
+        self.deadline = deadline
+        self.task = None
+        self.running = False
+        self.tick_stats = {'ticks': 0, 'skipped': 0, 'overruns': 0, 'errors': 0, 'total_duration': 0,
+                           'max_duration': 0, 'max_lag': 0, 'processed': 0, 'deferred': 0}
+        self.last = None
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def start(self, func):
+        # func(deadline) returns the number of items processed and deferred
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._loop(func))
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    async def _loop(self, func):
+        due = time.monotonic()
+        while True:
+            await asyncio.sleep(max(0, due - time.monotonic()))
+            start = time.monotonic()
+            lag = start - due
+            processed, deferred = 0, 0
+            self.running = True
+            try:
+                processed, deferred = await func(start + self.deadline)
+            except Exception:
+                self.tick_stats['errors'] += 1
+                self.logger.error(f"Error in {self.name} tick: {str(traceback.format_exc())}")
+            finally:
+                self.running = False
+            end = time.monotonic()
+            duration = end - start
+
+            due += self.interval
+            skipped = 0
+            if due < end:
+                skipped = int((end - due) // self.interval)
+                due += skipped * self.interval
+                self.tick_stats['overruns'] += 1
+                self.logger.warning(f"{self.name} tick took {duration:.1f}s, longer than its {self.interval}s "
+                                    f"interval, {skipped + 1} ticks coalesced into the next one")
+            self._record(lag, duration, skipped, processed, deferred)
+
+    def _record(self, lag, duration, skipped, processed, deferred):
+        stats = self.tick_stats
+        stats['ticks'] += 1
+        stats['skipped'] += skipped
+        stats['total_duration'] += duration
+        stats['max_duration'] = max(stats['max_duration'], duration)
+        stats['max_lag'] = max(stats['max_lag'], lag)
+        stats['processed'] += processed
+        stats['deferred'] += deferred
+        self.last = {'lag': lag, 'duration': duration, 'processed': processed, 'deferred': deferred}
+        if processed or deferred:
+            self.logger.debug(f"{self.name} tick: {processed} processed, {deferred} deferred, "
+                              f"took {duration:.2f}s, started {lag:.2f}s late")
+
+    def stats(self):
+        stats = self.tick_stats
+        return {
+            'running': self.running,
+            'ticks': stats['ticks'],
+            'skipped': stats['skipped'],
+            'overruns': stats['overruns'],
+            'errors': stats['errors'],
+            'avg_duration': stats['total_duration'] / stats['ticks'] if stats['ticks'] else 0,
+            'max_duration': stats['max_duration'],
+            'max_lag': stats['max_lag'],
+            'processed': stats['processed'],
+            'deferred': stats['deferred'],
+            'last': self.last
+        }
@@ -1,16 +1,29 @@
+import asyncio
 import logging
 import time
 from collections import namedtuple
 from functools import cmp_to_key
 
+from constants import REPLACEMENT_DEADLINE
 from data import dbconn
-from utils import cf_api, codeforces
+from utils import cf_api, codeforces, rate_limiter
 
 logger = logging.getLogger(__name__)
 db = dbconn.DbConn()
-cf = cf_api.CodeforcesAPI()
+cf = cf_api.CodeforcesAPI(rate_limiter.POLLING)
 
-RECENT_SUBS_LIMIT = 50
+# Submissions are fetched newest first, SUBS_PAGE_SIZE at a time and doubling the page size until one from
+# before the start of the match is reached
+SUBS_PAGE_SIZE = 10
+SUBS_MAX_PAGES = 6
+# A handle is polled with one contest.status call per contest of its matches instead when that takes fewer calls
+# than paging its user.status did. Every CONTEST_STATUS_RECHECK polls user.status is tried again.
+CONTEST_STATUS_RECHECK = 10
+
+# handle -> [user.status pages its last poll needed, contest.status polls since then]
+poll_strategy = {}
+poll_stats = {method: {'polls': 0, 'requests': 0, 'submissions': 0, 'bytes': 0}
+              for method in ['user.status', 'contest.status']}
 
 
 def match_score(status):
@@ -40,12 +53,97 @@ def no_change_possible(match_status):
     return False
 
 
-async def update_match(match_info):
-    handle1, handle2 = db.get_handle(match_info.guild, match_info.p1_id), db.get_handle(match_info.guild,
-                                                                                        match_info.p2_id)
-    enter_time = time.time()
-    sub1, sub2 = await cf.get_user_problems(handle1, RECENT_SUBS_LIMIT), await cf.get_user_problems(handle2,
-                                                                                                    RECENT_SUBS_LIMIT)
+def match_handles(match_info):
+    return [db.get_handle(match_info.guild, match_info.p1_id), db.get_handle(match_info.guild, match_info.p2_id)]
+
+
+def round_handles(round_info):
+    return [db.get_handle(round_info.guild, user) for user in map(int, round_info.users.split())]
+
+
+def item_contests(info):
+    # Contests the unsolved problems of a match or round come from
+    return set(int(x.split('/')[0]) for x in info.problems.split() if x != '0')
+
+
+async def fetch_submissions(handle, since, deadline=None):
+    subs, start, count = [], 1, SUBS_PAGE_SIZE
+    for page in range(1, SUBS_MAX_PAGES + 1):
+        resp = await cf.get_user_submissions(handle, start, count, deadline)
+        poll_stats['user.status']['requests'] += 1
+        if not resp[0]:
+            return resp
+        poll_stats['user.status']['bytes'] += resp[2]
+        subs += resp[1]
+        if len(resp[1]) < count or resp[1][-1]['creationTimeSeconds'] < since:
+            poll_strategy[handle] = [page, 0]
+            return [True, subs]
+        start += count
+        count *= 2
+    logger.debug(f"Stopped paging submissions of {handle} after {len(subs)}")
+    poll_strategy[handle] = [SUBS_MAX_PAGES + 1, 0]
+    return [True, subs]
+
+
+async def fetch_contest_submissions(handle, contests, deadline=None):
+    resps = await asyncio.gather(*[cf.get_contest_submissions(contest, handle, deadline) for contest in contests])
+    poll_stats['contest.status']['requests'] += len(contests)
+    poll_strategy[handle][1] += 1
+    poll_stats['contest.status']['bytes'] += sum(resp[2] for resp in resps if resp[0])
+    for resp in resps:
+        if not resp[0]:
+            return resp
+    return [True, [sub for resp in resps for sub in resp[1]]]
+
+
+def use_contest_status(handle, contests):
+    state = poll_strategy.get(handle)
+    if not contests or state is None or not cf_api.is_available('contest.status'):
+        return False
+    return state[0] > len(contests) and state[1] < CONTEST_STATUS_RECHECK
+
+
+# handles: handle -> earliest start time of the matches and rounds it is polled for
+# contests: handle -> contests of their problems
+async def poll_handles(handles, contests, deadline=None):
+    # Submissions of every handle since that time, fetched and indexed once per update no matter how many
+    # matches and rounds it is in. Handles that couldn't be fetched before the deadline are left out.
+    subs = {}
+
+    async def poll(handle):
+        method = 'contest.status' if use_contest_status(handle, contests[handle]) else 'user.status'
+        try:
+            if method == 'contest.status':
+                resp = await fetch_contest_submissions(handle, contests[handle], deadline)
+            else:
+                resp = await fetch_submissions(handle, handles[handle], deadline)
+        except (cf_api.DeadlineExceeded, cf_api.CircuitOpen):
+            return
+        if resp[0]:
+            poll_stats[method]['polls'] += 1
+            poll_stats[method]['submissions'] += len(resp[1])
+        subs[handle] = [True, codeforces.index_submissions(resp[1])] if resp[0] else resp
+
+    rest = list(handles)
+    if rest and not cf_api.is_closed('user.status'):
+        # Codeforces was down, only the probe goes out and the rest follow once it got through
+        await poll(rest.pop(0))
+        if not cf_api.is_closed('user.status'):
+            return subs
+    # The rate limiter paces the requests, handles are served in the order given
+    await asyncio.gather(*[poll(handle) for handle in rest])
+    return subs
+
+
+def submitted_since(subs, handles, start):
+    return any(sub[0] and sub[1].last_time >= start for sub in [subs[handle] for handle in handles])
+
+
+# handles: result of match_handles, subs: result of poll_handles, enter_time: when polling started
+# Only works out what changed, writing it is left to the caller
+async def update_match(match_info, handles, subs, enter_time):
+    handle1, handle2 = handles
+    sub1, sub2 = subs[handle1], subs[handle2]
     if not sub1[0]:
         return sub1
     if not sub2[0]:
@@ -63,8 +161,8 @@ async def update_match(match_info):
             new_status += match_info.status[i]
             continue
 
-        time1, time2 = codeforces.get_solve_time(sub1, int(problems[i].split('/')[0]), problems[i].split('/')[1]), \
-            codeforces.get_solve_time(sub2, int(problems[i].split('/')[0]), problems[i].split('/')[1])
+        id, index = problems[i].split('/')
+        time1, time2 = codeforces.get_solve_time(sub1, id, index), codeforces.get_solve_time(sub2, id, index)
 
         if time1 == -1 or time2 == -1:
             judging = True
@@ -83,12 +181,10 @@ async def update_match(match_info):
         else:
             new_status += '0'
 
-    if len(updates):
-        db.update_match_status(match_info, new_status)
     if not judging and (enter_time > match_info.time + 60 * match_info.duration or no_change_possible(new_status)):
         over = True
 
-    return [True, [updates, over, new_status]]
+    return [True, [updates, over, new_status, judging]]
 
 
 def round_score(users, status, times):
@@ -126,15 +222,14 @@ def no_round_change_possible(status, points, problems):
     return True
 
 
-async def update_round(round_info):
+# handles: result of round_handles
+async def update_round(round_info, handles, subs, enter_time):
     users = list(map(int, round_info.users.split()))
-    handles = [db.get_handle(round_info.guild, user) for user in users]
     rating = list(map(int, round_info.rating.split()))
-    enter_time = time.time()
     points = list(map(int, round_info.points.split()))
     status = list(map(int, round_info.status.split()))
     timestamp = list(map(int, round_info.times.split()))
-    subs = [await cf.get_user_problems(handle, RECENT_SUBS_LIMIT) for handle in handles]
+    subs = [subs[handle] for handle in handles]
     for sub in subs:
         if not sub[0]:
             return sub
@@ -150,8 +245,8 @@ async def update_round(round_info):
             updates.append([])
             continue
 
-        times = [codeforces.get_solve_time(sub, int(problems[i].split('/')[0]),
-                                           problems[i].split('/')[1]) for sub in subs]
+        id, index = problems[i].split('/')
+        times = [codeforces.get_solve_time(sub, id, index) for sub in subs]
 
         if any([_ == -1 for _ in times]):
             judging = True
@@ -170,17 +265,16 @@ async def update_round(round_info):
         updates.append((solved))
 
         if len(solved) > 0 and round_info.repeat == 1:
-            res = await codeforces.find_problems(handles + db.fetch_alts(round_info.guild, users[0]), [rating[i]])
+            # Gets its own budget, the update's deadline may already be used up by polling
+            res = await codeforces.find_problems(handles + db.fetch_alts(round_info.guild, users[0]), [rating[i]],
+                                                 time.monotonic() + REPLACEMENT_DEADLINE, rate_limiter.POLLING)
             if not res[0]:
                 new_problem = '0'
             else:
                 new_problem = f"{res[1][0].id}/{res[1][0].index}"
             problems[i] = new_problem
 
-    if updated:
-        db.update_round_status(round_info.guild, users[0], status, problems, timestamp)
-
     if not judging and (enter_time > round_info.time + 60 * round_info.duration or (round_info.repeat ==
                         0 and no_round_change_possible(status[:], points, problems))):
         over = True
-    return [True, [updates, over, updated]]
+    return [True, [updates, over, updated, judging, [status, problems, timestamp]]]